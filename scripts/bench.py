@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+
+import json
+import os.path
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import config  # noqa, pylint: disable=unused-import
+from glyphdb import DATADIR
+from glyphdb import GlyphDB
+from glyphdb import set_glyphdb
+from mkdeps import DepGraph
+from mkotf import build_font
+from primitives import Use
+from profiling import get_peak_rss
+from writesvg import generate_svg
+from writesvg import get_interpolated_data
+from writesvg import normalize_size
+from writesvg import SVGRenderer
+
+
+ROOTDIR = os.path.join(os.path.dirname(__file__), "..")
+BENCHDIR = os.path.join(ROOTDIR, "build", "bench")
+
+# Results of a run on the maintainers' machine; throughput depends on the
+# machine, so save a baseline of your own before comparing changes
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "bench_baseline.json")
+
+# Bump when the generated corpora change
+CORPUS_VERSION = 3
+
+CORPUS_SIZES = {
+    "1k": 1000,
+    "10k": 10000,
+    "50k": 50000,
+}
+CORPORA = ["real", "1k", "10k", "50k"]
+
+STAGES = ["load", "dep_map", "interpolate", "render", "expand", "build_font"]
+
+# Glyphs built into the fonts besides those in the data directory, starting
+# with .notdef
+COMMON_GLYPHS = os.path.join(ROOTDIR, "glyph", "common.txt")
+
+# Levels of use nesting of the generated glyphs
+DEPTH = 6
+
+# Keys of generated glyphs in the order of width / height. The first and
+# the last keys are degenerate so that any aspect ratio can be
+# interpolated, as the keys of the glyphs in data do.
+KEY_SETS = [
+    [(0, 360), (360, 360), (360, 0)],
+    [(0, 360), (180, 360), (360, 180), (360, 0)],
+    [(0, 360), (120, 360), (360, 360), (360, 120), (360, 0)],
+]
+
+
+def format_glyph(name, lines, keys=()):
+    # Same layout as readsvg.dump_yaml, which is too slow for 50k glyphs
+    out = [
+        "name: {0}".format(name),
+        "width: 360",
+        "height: 360",
+        "rect: 0 0 360 360",
+        "data:",
+    ]
+    out.extend("- {0}".format(line) for line in lines)
+    if keys:
+        out.append("keys:")
+        for width, height, key_lines in keys:
+            out.append("- width: {0}".format(width))
+            out.append("  height: {0}".format(height))
+            out.append("  data:")
+            out.extend("  - {0}".format(line) for line in key_lines)
+    return "\n".join(out) + "\n"
+
+
+class CorpusGenerator(object):
+    # Deterministic synthetic glyphs. Glyphs of level 0 are made of strokes
+    # and glyphs of level k use two or three glyphs of lower levels, one of
+    # which is of level k - 1. Some glyphs of every level have keys.
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.rng = random.Random(seed)
+        self.levels = [[] for _ in range(DEPTH)]
+
+    def strokes(self, count, arcs=True):
+        # Strokes in the unit square: (kind, u0, v0, u1, v1). Arcs would
+        # degenerate to lines in the keys of zero width or height.
+        rng = self.rng
+        strokes = []
+        for _ in range(count):
+            kind = rng.choice(["line", "line", "arc" if arcs else "line"])
+            u0, v0, u1, v1 = [rng.randint(0, 12) / 12.0 for _ in range(4)]
+            if (u0, v0) == (u1, v1):
+                u1 = 1.0 - u0
+            strokes.append((kind, u0, v0, u1, v1))
+        return strokes
+
+    @staticmethod
+    def stroke_lines(strokes, width, height):
+        # The margin does not scale, so keys are not just resized copies
+        margin = min(24, width // 4, height // 4)
+
+        def point(u, v):
+            return (int(round(margin + u * (width - 2 * margin))),
+                    int(round(margin + v * (height - 2 * margin))))
+        lines = []
+        for kind, u0, v0, u1, v1 in strokes:
+            x0, y0 = point(u0, v0)
+            x1, y1 = point(u1, v1)
+            if kind == "line":
+                lines.append("path M {0},{1} {2},{3}".format(x0, y0, x1, y1))
+            else:
+                radius = max(abs(x1 - x0), abs(y1 - y0))
+                lines.append("path M {0},{1} A {2},{2} 0 0 1 {3},{4}".format(
+                    x0, y0, radius, x1, y1))
+        return lines
+
+    def layout(self, weights, vertical, width, height):
+        # Boxes along one axis with a fixed gap between them
+        gap = 12
+        length = height if vertical else width
+        avail = max(0, length - gap * (len(weights) - 1))
+        total = float(sum(weights))
+        boxes = []
+        pos = 0
+        for weight in weights:
+            size = int(round(avail * weight / total))
+            if vertical:
+                boxes.append((0, pos, width, size))
+            else:
+                boxes.append((pos, 0, size, height))
+            pos += size + gap
+        return boxes
+
+    def composite_lines(self, children, weights, vertical, width, height):
+        boxes = self.layout(weights, vertical, width, height)
+        return ["use {0} {1} {2} {3} {4}".format(x, y, w, h, child)
+                for child, (x, y, w, h) in zip(children, boxes)]
+
+    def glyph(self, index, level):
+        rng = self.rng
+        name = "b{0}x{1:05d}".format(level, index)
+        keyed = rng.random() < 0.3
+        if level == 0:
+            strokes = self.strokes(rng.randint(2, 4), arcs=not keyed)
+
+            def make_lines(width, height):
+                return self.stroke_lines(strokes, width, height)
+        else:
+            children = [rng.choice(self.levels[level - 1])]
+            for _ in range(rng.randint(1, 2)):
+                children.append(rng.choice(
+                    self.levels[rng.randrange(level)]))
+            weights = [rng.randint(1, 2) for _ in children]
+            # Alternate the direction as glyphs nested in the same direction
+            # would soon get too thin to be normalized
+            vertical = level % 2 == 1
+
+            def make_lines(width, height):
+                # Keys are split along their longer side
+                if width != height:
+                    along = height > width
+                else:
+                    along = vertical
+                return self.composite_lines(children, weights, along,
+                                            width, height)
+        self.levels[level].append(name)
+        if not keyed:
+            return name, format_glyph(name, make_lines(360, 360))
+        keys = [(width, height, make_lines(width, height))
+                for width, height in rng.choice(KEY_SETS)]
+        return name, format_glyph(
+            name, ["use 0 0 360 360 {0}".format(name)], keys)
+
+    def generate(self):
+        # Glyphs are spread evenly over the levels; a glyph of each level
+        # is made before the first glyph of the next level needs it
+        for index in range(self.size):
+            yield self.glyph(index, index % DEPTH)
+
+
+def get_corpus_dir(corpus):
+    return os.path.join(BENCHDIR, corpus)
+
+
+def get_corpus_paths(corpus):
+    # (data directory, bundle path)
+    corpusdir = get_corpus_dir(corpus)
+    if corpus == "real":
+        datadir = DATADIR
+    else:
+        datadir = os.path.join(corpusdir, "data")
+    return datadir, os.path.join(corpusdir, "glyphs.pickle")
+
+
+def prepare_corpus(corpus):
+    # Generates the corpus unless it is up to date and bundles its glyphs
+    corpusdir = get_corpus_dir(corpus)
+    datadir, bundlepath = get_corpus_paths(corpus)
+    os.makedirs(corpusdir, exist_ok=True)
+    if corpus != "real":
+        stamp = "{0} {1}\n".format(CORPUS_VERSION, CORPUS_SIZES[corpus])
+        stamppath = os.path.join(corpusdir, "stamp")
+        try:
+            with open(stamppath) as stampfile:
+                uptodate = stampfile.read() == stamp
+        except FileNotFoundError:
+            uptodate = False
+        if not uptodate:
+            print("generating {0} corpus".format(corpus), file=sys.stderr)
+            os.makedirs(datadir, exist_ok=True)
+            for filename in os.listdir(datadir):
+                os.remove(os.path.join(datadir, filename))
+            if os.path.exists(bundlepath):
+                os.remove(bundlepath)
+            generator = CorpusGenerator(CORPUS_SIZES[corpus])
+            for name, text in generator.generate():
+                with open(os.path.join(datadir, name + ".yaml"),
+                          "w") as yamlfile:
+                    yamlfile.write(text)
+            with open(stamppath, "w") as stampfile:
+                stampfile.write(stamp)
+    glyphdb = GlyphDB(bundlepath, datadir)
+    glyphdb.update()
+    glyphdb.save()
+
+
+def bench_load(glyphdb, _names):
+    # Parses every YAML file, ignoring the bundle
+    GlyphDB(None, glyphdb.datadir).update()
+
+
+def bench_dep_map(_glyphdb, _names):
+    DepGraph.from_glyphdb().check_cycles()
+
+
+def bench_interpolate(glyphdb, names):
+    # Interpolates every glyph used directly or indirectly, once per size
+    done = set()
+    stack = []
+    for name in names:
+        stack.extend(
+            prim for prim in glyphdb.get(name)["data"]
+            if isinstance(prim, Use))
+        while stack:
+            use = stack.pop()
+            size = normalize_size(use.width, use.height)
+            if (use.name, size) in done:
+                continue
+            done.add((use.name, size))
+            data = get_interpolated_data(use.name, use.width, use.height)
+            stack.extend(
+                prim for prim in data["data"] if isinstance(prim, Use))
+
+
+def bench_render(glyphdb, names, expand=False):
+    renderer = SVGRenderer(expand=expand)
+    for name in names:
+        generate_svg(glyphdb.get(name), renderer=renderer)
+
+
+def bench_expand(glyphdb, names):
+    bench_render(glyphdb, names, expand=True)
+
+
+def bench_build_font(glyphdb, _names):
+    with open(COMMON_GLYPHS) as listfile:
+        srcs = [os.path.join(ROOTDIR, line.strip()) for line in listfile]
+    srcs.append(glyphdb.datadir)
+    outfile = os.path.join(BENCHDIR, "bench-{0}.otf".format(os.getpid()))
+    try:
+        build_font(srcs, {"psName": "Bench"}, outfile)
+    finally:
+        if os.path.exists(outfile):
+            os.remove(outfile)
+
+
+BENCH_FUNCS = {
+    "load": bench_load,
+    "dep_map": bench_dep_map,
+    "interpolate": bench_interpolate,
+    "render": bench_render,
+    "expand": bench_expand,
+    "build_font": bench_build_font,
+}
+
+
+def run_stage(corpus, stage):
+    # Runs in a process of its own so that caches of previous stages do not
+    # help and the peak RSS is that of the stage
+    datadir, bundlepath = get_corpus_paths(corpus)
+    glyphdb = GlyphDB(bundlepath, datadir)
+    set_glyphdb(glyphdb)
+    glyphdb.update()
+    names = glyphdb.names()
+    setup_rss = get_peak_rss()
+    start = time.perf_counter()
+    BENCH_FUNCS[stage](glyphdb, names)
+    elapsed = time.perf_counter() - start
+    return {
+        "glyphs": len(names),
+        "time": elapsed,
+        "glyphs_per_s": len(names) / elapsed if elapsed > 0 else None,
+        "peak_rss_kb": get_peak_rss(),
+        "setup_rss_kb": setup_rss,
+    }
+
+
+def bench_stage(corpus, stage, repeat=1, timeout=None):
+    # Best of `repeat` runs, or {"error": ...} if the stage fails
+    best = None
+    for _ in range(repeat):
+        try:
+            proc = subprocess.run(
+                [sys.executable, __file__, "--worker", corpus, stage],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, timeout=timeout, check=False)
+        except subprocess.TimeoutExpired:
+            return {"error": "timed out after {0} s".format(timeout)}
+        if proc.returncode != 0:
+            lines = proc.stderr.strip().splitlines() or [
+                "exit status {0}".format(proc.returncode)]
+            return {"error": lines[-1]}
+        result = json.loads(proc.stdout)
+        if best is None or result["time"] < best["time"]:
+            best = result
+    return best
+
+
+def compare(result, baseline, threshold):
+    # Relative change of throughput and peak RSS, and whether either is
+    # worse than the threshold or the stage fails. Failures are never
+    # saved as a baseline; one found in an older baseline file is taken as
+    # no baseline.
+    if "error" in result:
+        return None, None, True
+    if baseline is None or "error" in baseline:
+        return None, None, False
+    speed = result["glyphs_per_s"] / baseline["glyphs_per_s"] - 1.0
+    memory = result["peak_rss_kb"] / float(baseline["peak_rss_kb"]) - 1.0
+    return speed, memory, speed < -threshold or memory > threshold
+
+
+def format_change(change):
+    if change is None:
+        return "-"
+    return "{0:+.0%}".format(change)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="benchmark the stages of the build on the glyphs in "
+        "data and on generated corpora")
+    parser.add_argument("--corpus", "-c", action="append",
+                        choices=CORPORA, default=None,
+                        help="corpus to run (default: all)")
+    parser.add_argument("--stage", "-s", action="append",
+                        choices=STAGES, default=None,
+                        help="stage to run (default: all)")
+    parser.add_argument("--repeat", "-r", type=int, default=1,
+                        help="take the best of this many runs")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="give up a stage after this many seconds")
+    parser.add_argument("--baseline", "-b", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="save the results to the baseline file "
+                        "instead of comparing them; failed stages are not "
+                        "saved")
+    parser.add_argument("--threshold", "-t", type=float, default=0.2,
+                        help="fail if throughput falls or peak RSS grows "
+                        "by more than this ratio")
+    parser.add_argument("--outfile", "-o", default=None,
+                        help="write the results to this JSON file")
+    parser.add_argument("--worker", nargs=2, metavar=("CORPUS", "STAGE"),
+                        help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        json.dump(run_stage(*args.worker), sys.stdout)
+        return
+
+    corpora = args.corpus or CORPORA
+    stages = args.stage or STAGES
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as baselinefile:
+            baseline = json.load(baselinefile)["results"]
+
+    print("{0:<6} {1:<12} {2:>7} {3:>9} {4:>10} {5:>9} {6:>9} {7:>7} "
+          "{8:>7}".format("corpus", "stage", "glyphs", "time (s)",
+                          "glyphs/s", "RSS(MiB)", "+stage", "speed",
+                          "memory"))
+    results = {}
+    regressions = []
+    failures = []
+    for corpus in corpora:
+        prepare_corpus(corpus)
+        results[corpus] = {}
+        for stage in stages:
+            result = bench_stage(corpus, stage, repeat=args.repeat,
+                                 timeout=args.timeout)
+            results[corpus][stage] = result
+            speed, memory, regressed = compare(
+                result, baseline.get(corpus, {}).get(stage), args.threshold)
+            if "error" in result:
+                failures.append((corpus, stage))
+                print("{0:<6} {1:<12} FAILED: {2}".format(
+                    corpus, stage, result["error"]))
+                continue
+            regressed = regressed and not args.save_baseline
+            if regressed:
+                regressions.append((corpus, stage))
+            print("{0:<6} {1:<12} {2:>7} {3:>9.3f} {4:>10.1f} {5:>9.1f} "
+                  "{6:>9.1f} {7:>7} {8:>7}{9}".format(
+                      corpus, stage, result["glyphs"], result["time"],
+                      result["glyphs_per_s"], result["peak_rss_kb"] / 1024.0,
+                      (result["peak_rss_kb"] - result["setup_rss_kb"]) /
+                      1024.0,
+                      format_change(speed), format_change(memory),
+                      "  REGRESSION" if regressed else ""))
+            sys.stdout.flush()
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.outfile is not None:
+        with open(args.outfile, "w") as outfile:
+            json.dump(report, outfile, indent=1, sort_keys=True)
+            outfile.write("\n")
+    if args.save_baseline:
+        saved = {}
+        if os.path.exists(args.baseline):
+            # Keep the results of corpora and stages not run this time
+            with open(args.baseline) as baselinefile:
+                saved = json.load(baselinefile)["results"]
+        for corpus, corpus_results in results.items():
+            saved.setdefault(corpus, {}).update(
+                (stage, result) for stage, result in corpus_results.items()
+                if "error" not in result)
+        report["results"] = saved
+        with open(args.baseline, "w") as baselinefile:
+            json.dump(report, baselinefile, indent=1, sort_keys=True)
+            baselinefile.write("\n")
+    problems = []
+    if failures:
+        problems.append("failed: {0}".format(", ".join(
+            "{0}/{1}".format(corpus, stage) for corpus, stage in failures)))
+    if regressions:
+        problems.append("regressed: {0}".format(", ".join(
+            "{0}/{1}".format(corpus, stage)
+            for corpus, stage in regressions)))
+    if problems:
+        sys.exit("; ".join(problems))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+from fontTools.cffLib import PrivateDict
+from fontTools.misc.psCharStrings import T2CharString
+
+
+class BoundedCharString(T2CharString):
+    # The bounds are computed once, when the charstring is made, as
+    # FontBuilder asks for them again for each of hhea, vhea, head and the
+    # FontBBox. The bounds do not depend on the private dict to be set
+    # later, so a default one is used meanwhile.
+    def __init__(self, program):
+        super().__init__(program=program, private=PrivateDict())
+        self.bounds = super().calcBounds(None)
+
+    def calcBounds(self, glyphSet):
+        return self.bounds
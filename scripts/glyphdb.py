@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import glob
+import os.path
+import pickle
+
+import yaml
+
+from primitives import compile_glyph
+from profiling import add_profile_argument
+from profiling import setup_profile
+from profiling import stage
+from util import LRUCache
+
+
+DATADIR = os.path.join(os.path.dirname(__file__), "..", "data")
+BUNDLE_PATH = os.path.join(os.path.dirname(__file__), "..",
+                           "build", "glyphs.pickle")
+
+# Bump when the layout of the bundle or of the compiled records changes
+BUNDLE_VERSION = 2
+
+
+def get_yamlpath(name, datadir=DATADIR):
+    return os.path.join(datadir, "{0}.yaml".format(name))
+
+
+class GlyphDB(object):
+    # Compiled glyph records keyed by name. Records are read from the
+    # bundle if present and from the YAML files whose mtime differs from
+    # the one recorded in the bundle. The scripts keep every record, while
+    # long-lived processes bound their number by set_cache_size.
+
+    def __init__(self, bundlepath=BUNDLE_PATH, datadir=DATADIR):
+        self.bundlepath = bundlepath
+        self.datadir = datadir
+        self.entries = LRUCache()
+        self.modified = False
+        if bundlepath is not None and os.path.exists(bundlepath):
+            with stage("load_bundle"), open(bundlepath, "rb") as bundlefile:
+                bundle = pickle.load(bundlefile)
+            if bundle.get("version") == BUNDLE_VERSION:
+                for name, entry in bundle["entries"].items():
+                    self.entries[name] = entry
+
+    def set_cache_size(self, maxsize):
+        # Maximum number of records kept; records dropped are read again
+        # from the YAML files when needed
+        self.entries.resize(maxsize)
+
+    def get(self, name):
+        yamlpath = get_yamlpath(name, self.datadir)
+        mtime = os.path.getmtime(yamlpath)
+        entry = self.entries.get(name)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        with stage("parse_yaml", name), open(yamlpath) as yamlfile:
+            data = compile_glyph(yaml.safe_load(yamlfile))
+        self.entries[name] = (mtime, data)
+        self.modified = True
+        return data
+
+    def names(self):
+        return sorted(
+            os.path.splitext(os.path.basename(yamlpath))[0]
+            for yamlpath in glob.glob(os.path.join(self.datadir, "*.yaml")))
+
+    def update(self):
+        names = self.names()
+        for name in set(self.entries) - set(names):
+            del self.entries[name]
+            self.modified = True
+        for name in names:
+            self.get(name)
+
+    def items(self):
+        self.update()
+        for name in self.names():
+            yield name, self.entries[name][1]
+
+    def save(self, bundlepath=None):
+        if bundlepath is None:
+            bundlepath = self.bundlepath
+        if not self.modified and bundlepath == self.bundlepath:
+            return
+        tmpname = bundlepath + ".tmp"
+        with stage("save_bundle"), open(tmpname, "wb") as bundlefile:
+            pickle.dump({
+                "version": BUNDLE_VERSION,
+                "entries": dict(self.entries.items()),
+            }, bundlefile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, bundlepath)
+        self.modified = False
+
+
+def load_file(yamlfile):
+    # Glyphs in the data directory are taken from the database
+    name = os.path.splitext(os.path.basename(yamlfile))[0]
+    glyphdb = get_glyphdb()
+    yamlpath = get_yamlpath(name, glyphdb.datadir)
+    if os.path.exists(yamlpath) and os.path.samefile(yamlfile, yamlpath):
+        return glyphdb.get(name)
+    with stage("parse_yaml", name), open(yamlfile) as infile:
+        return compile_glyph(yaml.safe_load(infile))
+
+
+_glyphdb = None
+
+
+def get_glyphdb():
+    global _glyphdb  # pylint: disable=global-statement
+    if _glyphdb is None:
+        _glyphdb = GlyphDB()
+    return _glyphdb
+
+
+def set_glyphdb(glyphdb):
+    # Makes the scripts read the glyphs from another database, e.g. one of
+    # another data directory
+    global _glyphdb  # pylint: disable=global-statement
+    _glyphdb = glyphdb
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--outfile", "-o", default=BUNDLE_PATH)
+    add_profile_argument(parser)
+
+    args = parser.parse_args()
+    setup_profile(args.profile)
+
+    glyphdb = GlyphDB(args.outfile)
+    glyphdb.update()
+    glyphdb.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+import glob
+import hashlib
+import os.path
+import sys
+
+from fontTools.pens.areaPen import AreaPen
+from fontTools.pens.boundsPen import ControlBoundsPen
+from fontTools.pens.recordingPen import RecordingPen
+from fontTools.svgLib import parse_path
+import numpy as np
+
+import config  # noqa, pylint: disable=unused-import
+from mkotf import Outline
+from profiling import add_profile_argument
+from profiling import setup_profile
+from profiling import stage
+from proof import get_font_outlines
+from proof import render_outline
+from raster import compose_sheet
+from raster import write_png
+
+
+# Coordinates are compared to this many decimal places so that float noise
+# between builds does not count as a change
+PRECISION = 2
+
+
+def load_outlines(path):
+    # Outlines of a font or of a directory of outlined SVGs, e.g.
+    # build/union, by glyph name
+    with stage("load", os.path.basename(path)):
+        if os.path.isdir(path):
+            outlines = [Outline.from_svg(svgfile) for svgfile in
+                        sorted(glob.glob(os.path.join(path, "*.svg")))]
+        else:
+            outlines = get_font_outlines(path)
+    return {outline.name: outline for outline in outlines}
+
+
+def get_recording(outline):
+    if isinstance(outline.d, RecordingPen):
+        return outline.d
+    recording = RecordingPen()
+    if isinstance(outline.d, str):
+        parse_path(outline.d, recording)
+    else:
+        outline.d.draw(recording)
+    return recording
+
+
+class Fingerprint(object):
+    # Cheap summary of an outline; outlines with equal fingerprints are
+    # taken as unchanged without rendering them
+    __slots__ = ("advance", "bounds", "area", "points", "digest")
+
+    def __init__(self, outline):
+        recording = get_recording(outline)
+        self.advance = (outline.advwidth, outline.advheight)
+        pen = ControlBoundsPen(None)
+        recording.replay(pen)
+        self.bounds = None if pen.bounds is None else tuple(
+            round(value, PRECISION) for value in pen.bounds)
+        pen = AreaPen(None)
+        recording.replay(pen)
+        self.area = round(pen.value, PRECISION)
+        # Number of points of each segment, and a hash of the segments
+        # including their coordinates
+        structure = []
+        digest = hashlib.sha1()
+        for operator, points in recording.value:
+            structure.append("{0}{1}".format(operator[0], len(points)))
+            digest.update(operator.encode())
+            for x, y in points:
+                digest.update("{0:.{2}f},{1:.{2}f};".format(
+                    x, y, PRECISION).encode())
+        self.points = hashlib.sha1(" ".join(structure).encode()).hexdigest()
+        self.digest = digest.hexdigest()
+
+    def key(self):
+        return (self.advance, self.bounds, self.area, self.points,
+                self.digest)
+
+    def __eq__(self, other):
+        return self.key() == other.key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key())
+
+
+def get_empty_outline(outline):
+    # Stand-in for a glyph missing in one of the builds
+    return Outline(outline.name, RecordingPen(), outline.advwidth,
+                   outline.advheight)
+
+
+class GlyphDiff(object):
+    def __init__(self, name, status, old, new, old_print=None,
+                 new_print=None):
+        self.name = name
+        self.status = status
+        self.old = old
+        self.new = new
+        # Fingerprints of the outlines, reused by the report
+        self.old_print = Fingerprint(old) if old_print is None else old_print
+        self.new_print = Fingerprint(new) if new_print is None else new_print
+        # Coverage difference summed over the pixels, i.e. the area in
+        # pixels that is inked in only one of the builds
+        self.score = 0.0
+        # Number of pixels whose coverage differs by more than the
+        # threshold
+        self.pixels = 0
+        self.images = None
+
+    def render(self, size, threshold):
+        frame = (max(self.old.advwidth, self.new.advwidth),
+                 max(self.old.advheight, self.new.advheight))
+        with stage("rasterize", self.name):
+            old_image = render_outline(self.old, size, frame)
+            new_image = render_outline(self.new, size, frame)
+        diff = np.abs(old_image.astype(float) - new_image) / 255.0
+        self.score = float(diff.sum())
+        self.pixels = int((diff > threshold).sum())
+        if self.status == "changed" and self.pixels == 0:
+            self.status = "subpixel"
+        self.images = (old_image, new_image,
+                       np.round(255.0 * (1.0 - diff)).astype(np.uint8))
+
+
+def diff_outlines(old_outlines, new_outlines, size=128, threshold=0.25):
+    # Returns the glyphs whose fingerprints differ, the most changed first
+    diffs = []
+    with stage("fingerprint"):
+        for name in sorted(set(old_outlines) | set(new_outlines)):
+            old = old_outlines.get(name)
+            new = new_outlines.get(name)
+            if old is None:
+                diffs.append(GlyphDiff(name, "added",
+                                       get_empty_outline(new), new))
+            elif new is None:
+                diffs.append(GlyphDiff(name, "removed",
+                                       old, get_empty_outline(old)))
+            else:
+                old_print = Fingerprint(old)
+                new_print = Fingerprint(new)
+                if old_print != new_print:
+                    diffs.append(GlyphDiff(name, "changed", old, new,
+                                           old_print, new_print))
+    for diff in diffs:
+        diff.render(size, threshold)
+    diffs.sort(key=lambda diff: (-diff.score, diff.name))
+    return diffs
+
+
+def format_report(diffs, size, total):
+    lines = ["rank\tglyph\tstatus\tdiff_area\tchanged_pixels\told_area"
+             "\tnew_area\told_bounds\tnew_bounds"]
+    for rank, diff in enumerate(diffs, 1):
+        old = diff.old_print
+        new = diff.new_print
+        lines.append("{0}\t{1}\t{2}\t{3:.2%}\t{4}\t{5}\t{6}\t{7}\t{8}".format(
+            rank, diff.name, diff.status, diff.score / (size * size),
+            diff.pixels, abs(old.area), abs(new.area),
+            format_bounds(old.bounds), format_bounds(new.bounds)))
+    lines.append("# {0} glyphs, {1} with different fingerprints, {2} "
+                 "visibly changed".format(
+                     total, len(diffs),
+                     sum(1 for diff in diffs if diff.pixels)))
+    return "\n".join(lines) + "\n"
+
+
+def format_bounds(bounds):
+    if bounds is None:
+        return "-"
+    return ",".join("{0:g}".format(value) for value in bounds)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="list the glyphs that differ between two builds, the "
+        "most changed first")
+    parser.add_argument("old",
+                        help="font, e.g. namekeyed.otf, or directory of "
+                        "outlined SVGs, e.g. build/union")
+    parser.add_argument("new")
+    parser.add_argument("--outfile", "-o", default=None,
+                        help="write the report to this file instead of "
+                        "stdout")
+    parser.add_argument("--outdir", "-d", default=None,
+                        help="write the old glyph, the new glyph and their "
+                        "difference side by side to OUTDIR/NAME.png for "
+                        "each differing glyph")
+    parser.add_argument("--size", "-s", type=int, default=128,
+                        help="size in pixels at which glyphs with "
+                        "different fingerprints are compared")
+    parser.add_argument("--threshold", "-t", type=float, default=0.25,
+                        help="minimum coverage difference of a pixel to "
+                        "count as changed")
+    add_profile_argument(parser)
+
+    args = parser.parse_args()
+    setup_profile(args.profile)
+
+    old_outlines = load_outlines(args.old)
+    new_outlines = load_outlines(args.new)
+    diffs = diff_outlines(old_outlines, new_outlines, size=args.size,
+                          threshold=args.threshold)
+    report = format_report(diffs, args.size,
+                           len(set(old_outlines) | set(new_outlines)))
+    if args.outfile is None:
+        sys.stdout.write(report)
+    else:
+        with open(args.outfile, "w") as outfile:
+            outfile.write(report)
+
+    if args.outdir is not None:
+        os.makedirs(args.outdir, exist_ok=True)
+        with stage("write"):
+            for diff in diffs:
+                write_png(os.path.join(args.outdir, "{0}.png".format(
+                    diff.name)), compose_sheet(list(diff.images), 3))
+
+
+if __name__ == "__main__":
+    main()
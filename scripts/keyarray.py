@@ -0,0 +1,107 @@
+import numpy as np
+
+from pathdata import PathData
+from primitives import Path
+from primitives import Rect
+from primitives import Use
+from util import LRUCache
+
+
+class InterpolateError(ValueError):
+    pass
+
+
+class CompiledKey(object):
+    # A key compiled into flat arrays. Boxes of use and rect lines are
+    # stored in `boxes`, coordinates of path points in `coords`, and
+    # `lines` keeps the structure needed to make the data again:
+    #   ("use", box_offset, name)
+    #   ("rect", box_offset)
+    #   ("path", coord_offset, coord_end, ops, arcs)
+    __slots__ = ("lines", "boxes", "coords")
+
+    def __init__(self, key):
+        self.lines = []
+        boxes = []
+        coords = []
+        for prim in key["data"]:
+            if isinstance(prim, Use):
+                self.lines.append(("use", len(boxes), prim.name))
+                boxes.extend([prim.x, prim.y, prim.width, prim.height])
+            elif isinstance(prim, Rect):
+                self.lines.append(("rect", len(boxes)))
+                boxes.extend([prim.x, prim.y, prim.width, prim.height])
+            elif isinstance(prim, Path):
+                path = prim.parsed()
+                offset = len(coords)
+                coords.extend(path.coords)
+                self.lines.append(("path", offset, len(coords), path.ops,
+                                   path.arcs))
+        self.boxes = np.array(boxes, dtype=np.float64)
+        self.coords = np.array(coords, dtype=np.float64)
+
+
+_compiled_keys = LRUCache()
+
+
+def set_cache_size(maxsize):
+    _compiled_keys.resize(maxsize)
+
+
+def compile_key(key):
+    # Keyed by identity; the key itself is kept so that the id stays valid
+    cached = _compiled_keys.get(id(key))
+    if cached is None or cached[0] is not key:
+        cached = (key, CompiledKey(key))
+        _compiled_keys[id(key)] = cached
+    return cached[1]
+
+
+def check_compatible(ckey0, ckey1):
+    if len(ckey0.lines) != len(ckey1.lines):
+        raise InterpolateError("numbers of lines do not match")
+    for line0, line1 in zip(ckey0.lines, ckey1.lines):
+        if line0[0] != line1[0]:
+            raise InterpolateError("linetypes do not match")
+        if line0[0] == "use":
+            if line0[2] != line1[2]:
+                raise InterpolateError("use names do not match")
+        elif line0[0] == "path":
+            if len(line0[3]) != len(line1[3]):
+                raise InterpolateError("number of segments do not match")
+            if line0[3] != line1[3]:
+                raise InterpolateError("type of segments do not match")
+            check_arcs(line0[4], line1[4])
+
+
+def check_arcs(arcs0, arcs1):
+    # Arcs are lowered to cubic Béziers, which must not be interpolated
+    # with other Béziers or with arcs of other flags
+    if [arc[0] for arc in arcs0] != [arc[0] for arc in arcs1]:
+        raise InterpolateError("type of segments do not match")
+    for arc0, arc1 in zip(arcs0, arcs1):
+        if not arc0[1] == arc1[1] == 0:
+            raise InterpolateError(
+                "cannot interpolate arc segments with rotation")
+        if arc0[2:] != arc1[2:]:
+            raise InterpolateError("arc segments' flags do not match")
+
+
+def interpolate_compiled(ckey0, ckey1, c0, c1):
+    check_compatible(ckey0, ckey1)
+
+    boxes = (ckey0.boxes * c0 + ckey1.boxes * c1).tolist()
+    coords = (ckey0.coords * c0 + ckey1.coords * c1).tolist()
+
+    glyph = []
+    for line in ckey0.lines:
+        if line[0] == "use":
+            offset = line[1]
+            glyph.append(Use(*boxes[offset:offset + 4], line[2]))
+        elif line[0] == "rect":
+            offset = line[1]
+            glyph.append(Rect(*boxes[offset:offset + 4]))
+        elif line[0] == "path":
+            _linetype, offset, end, ops, arcs = line
+            glyph.append(Path(parsed=PathData(ops, coords[offset:end], arcs)))
+    return glyph
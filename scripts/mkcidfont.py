@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+
+import math
+import os.path
+import re
+
+from fontTools.cffLib import CFFFontSet
+from fontTools.cffLib import CharStrings
+from fontTools.cffLib import FDArrayIndex
+from fontTools.cffLib import FDSelect
+from fontTools.cffLib import FontDict
+from fontTools.cffLib import GlobalSubrsIndex
+from fontTools.cffLib import PrivateDict
+from fontTools.cffLib import TopDict
+from fontTools.cffLib import TopDictIndex
+from fontTools.cffLib.width import optimizeWidths
+from fontTools.feaLib.builder import addOpenTypeFeatures
+from fontTools.fontBuilder import FontBuilder
+from fontTools.misc.roundTools import otRound
+from fontTools.misc.timeTools import timestampNow
+from fontTools.pens.t2CharStringPen import T2CharStringPen
+from fontTools.ttLib import newTable
+from fontTools.ttLib import TTFont
+from fontTools.ttLib.tables._c_m_a_p import CmapSubtable
+from fontTools.ttLib.tables._n_a_m_e import makeName
+
+import config  # noqa, pylint: disable=unused-import
+from charstring import BoundedCharString
+from mkvmtxfeat import get_glyph_name
+from mkvmtxfeat import parse_map
+from mkvmtxfeat import VMTXFeatureGenerator
+from profiling import add_profile_argument
+from profiling import setup_profile
+from profiling import stage
+
+
+# CMaps (in the resources of AFDKO) from which the cmap subtables are made
+CMAPS = {
+    ("Adobe", "Japan1"): ("UniJIS2004-UTF32-H", "83pv-RKSJ-H"),
+}
+
+# Code page bits of OS/2 ulCodePageRange1 implied by the character
+# collection, which the heuristics of fontTools do not detect from kana
+CODE_PAGE_BITS = {
+    ("Adobe", "Japan1"): 17,
+}
+
+STANDARD_STYLES = {"Regular", "Bold", "Italic", "Bold Italic"}
+
+# OS/2 values that makeotf derives when neither the fontmeta files nor the
+# features give them: the vendor ID, and sizes and offsets in units of the
+# em. A Vendor statement in the OS/2 table of the features overrides the
+# vendor ID, as the features are applied afterwards.
+DEFAULT_VENDOR = "UKWN"
+SUBSCRIPT_X_SIZE = SUPERSCRIPT_X_SIZE = 0.65
+SUBSCRIPT_Y_SIZE = SUPERSCRIPT_Y_SIZE = 0.6
+SUBSCRIPT_Y_OFFSET = 0.075
+SUPERSCRIPT_Y_OFFSET = 0.35
+STRIKEOUT_POSITION = 0.22
+
+
+def parse_cidfontinfo(infopath):
+    info = {}
+    with open(infopath) as infofile:
+        for line in infofile:
+            if not line.strip():
+                continue
+            key, value = line.split(None, 1)
+            value = value.strip()
+            if value.startswith("(") and value.endswith(")"):
+                info[key] = value[1:-1]
+            else:
+                info[key] = int(value)
+    return info
+
+
+def get_resource_path(registry, ordering, name):
+    # Imported here only to locate its resource files
+    import afdko  # pylint: disable=import-outside-toplevel
+    return os.path.join(os.path.dirname(afdko.__file__), "resources",
+                        "{0}-{1}".format(registry, ordering), name)
+
+
+_CIDRANGE_RE = re.compile(r"<([0-9a-fA-F]+)>\s*<([0-9a-fA-F]+)>\s*(\d+)")
+_CIDCHAR_RE = re.compile(r"<([0-9a-fA-F]+)>\s*(\d+)")
+
+
+def parse_cmap(cmappath):
+    # Code -> CID mapping of a PostScript CMap resource. Codes in notdef
+    # ranges are mapped to the CID of the range like makeotf does.
+    mapping = {}
+    section = None
+    with open(cmappath, encoding="latin-1") as cmapfile:
+        for line in cmapfile:
+            line = line.strip()
+            if line.startswith("%"):
+                continue
+            if line.endswith(("begincidrange", "beginnotdefrange",
+                              "begincidchar")):
+                section = line.split()[-1][len("begin"):]
+                continue
+            if line.startswith("end"):
+                section = None
+                continue
+            if section in ("cidrange", "notdefrange"):
+                match = _CIDRANGE_RE.match(line)
+                first, last = int(match.group(1), 16), int(match.group(2), 16)
+                cid = int(match.group(3))
+                for code in range(first, last + 1):
+                    if section == "cidrange":
+                        mapping[code] = cid + code - first
+                    else:
+                        mapping[code] = cid
+            elif section == "cidchar":
+                match = _CIDCHAR_RE.match(line)
+                mapping[int(match.group(1), 16)] = int(match.group(2))
+    return mapping
+
+
+def parse_uvs_sequences(uvspath):
+    # Lines are "<base> <selector>; <collection>; CID+<cid>"
+    sequences = []
+    with open(uvspath) as uvsfile:
+        for line in uvsfile:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            fields = [field.strip() for field in line.split(";")]
+            base, selector = [int(code, 16) for code in fields[0].split()]
+            cid = int(fields[-1][len("CID+"):])
+            sequences.append((base, selector, cid))
+    return sequences
+
+
+def _decode_menu_name(platform_id, string):
+    # \XXXX escapes UTF-16 code units for Windows, \XX bytes for Macintosh
+    if platform_id == 3:
+        return re.sub(r"\\([0-9a-fA-F]{4})",
+                      lambda m: chr(int(m.group(1), 16)), string)
+    return re.sub(rb"\\([0-9a-fA-F]{2})",
+                  lambda m: bytes([int(m.group(1), 16)]),
+                  string.encode("latin-1"))
+
+
+def parse_fontmenunamedb(dbpath, psname):
+    # Returns {key: [(platformID, platEncID, langID, string)]} of the
+    # section of psname. Names without the IDs are for English Windows
+    # and Macintosh.
+    names = {}
+    section = None
+    with open(dbpath, encoding="latin-1") as dbfile:
+        for line in dbfile:
+            line = line.strip()
+            if line.startswith("[") and line.endswith("]"):
+                section = line[1:-1]
+                continue
+            if section != psname or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            fields = value.split(",", 3)
+            if len(fields) == 4:
+                platform_id, enc_id, lang_id = [
+                    int(field, 0) for field in fields[:3]]
+                entries = [(platform_id, enc_id, lang_id,
+                            _decode_menu_name(platform_id, fields[3]))]
+            else:
+                entries = [(3, 1, 0x409, value), (1, 0, 0, value)]
+            names.setdefault(key, []).extend(entries)
+    return names
+
+
+def setup_names(font, psname, menunames):
+    name = font["name"]
+    version = "{0:.3f}".format(font["head"].fontRevision)
+    vendor = font["OS/2"].achVendID.strip()
+    records = []
+    families = {(p, e, l): s for p, e, l, s in menunames["f"]}
+    styles = {(p, e, l): s for p, e, l, s in menunames.get("s", [])}
+    for ids, family in families.items():
+        style = styles.get(ids, "Regular")
+        if isinstance(style, bytes):
+            style_name = style.decode("latin-1")
+        else:
+            style_name = style
+        if style_name not in STANDARD_STYLES:
+            records.append((17, ids, style))
+            style = "Regular"
+        records.append((1, ids, family))
+        records.append((2, ids, style))
+        if ids in ((3, 1, 0x409), (1, 0, 0)):
+            fullname = family if style == "Regular" else \
+                "{0} {1}".format(family, style)
+            records.extend([
+                (3, ids, "{0};{1};{2}".format(version, vendor, psname)),
+                (4, ids, fullname),
+                (5, ids, "Version {0}".format(version)),
+                (6, ids, psname),
+            ])
+        elif ids[0] == 3:
+            records.append((4, ids, family))
+    for name_id, ids, string in records:
+        name.removeNames(name_id, *ids)
+        name.names.append(makeName(string, name_id, *ids))
+
+
+def setup_cid_cff(builder, psname, info, cidcount, charstrings, private):
+    # Like FontBuilder.setupCFF, but CID-keyed with a single FDArray entry
+    builder.font.sfntVersion = "OTTO"
+    glyph_order = builder.font.getGlyphOrder()
+    fontset = CFFFontSet()
+    fontset.major = 1
+    fontset.minor = 0
+    fontset.otFont = builder.font
+    fontset.fontNames = [psname]
+    fontset.topDictIndex = TopDictIndex()
+    fontset.GlobalSubrs = GlobalSubrsIndex()
+
+    private_dict = PrivateDict()
+    for key, value in private.items():
+        setattr(private_dict, key, value)
+    fontdict = FontDict()
+    fontdict.setCFF2(False)
+    fontdict.FontName = psname
+    fontdict.Private = private_dict
+    fdarray = FDArrayIndex()
+    fdarray.append(fontdict)
+    fdselect = FDSelect(format=3)
+    fdselect.gidArray = [0] * len(glyph_order)
+
+    topdict = TopDict()
+    topdict.ROS = (info["Registry"], info["Ordering"], info["Supplement"])
+    topdict.Notice = info["AdobeCopyright"]
+    topdict.FullName = info["FullName"]
+    topdict.FamilyName = info["FamilyName"]
+    topdict.Weight = info["Weight"]
+    topdict.CIDFontVersion = float(info["version"])
+    topdict.CIDCount = cidcount
+    topdict.charset = glyph_order
+    topdict.GlobalSubrs = fontset.GlobalSubrs
+    topdict.FDArray = fdarray
+    topdict.FDSelect = fdselect
+
+    topdict.CharStrings = CharStrings(
+        None, glyph_order, fontset.GlobalSubrs, None, fdselect, fdarray)
+    for name, charstring in charstrings.items():
+        charstring.private = private_dict
+        charstring.globalSubrs = fontset.GlobalSubrs
+        topdict.CharStrings[name] = charstring
+    fontset.topDictIndex.append(topdict)
+
+    builder.font["CFF "] = newTable("CFF ")
+    builder.font["CFF "].cff = fontset
+
+
+def build_cid_font(font, cidmap, info, featurefile, menunames,
+                   uvs_sequences=(), unicode_cmap=None, mac_cmap=None,
+                   subroutinize=False):
+    # Assembles the CID-keyed font from the name-keyed font made by mkotf,
+    # as mergefonts, tx and makeotf did
+    psname = info["FontName"]
+    cids = {
+        cid: name
+        for name, name_cids in cidmap.items() if name in font.getGlyphOrder()
+        for cid in name_cids
+    }
+    glyph_order = [get_glyph_name(cid) for cid in sorted(cids)]
+    names = {get_glyph_name(cid): name for cid, name in cids.items()}
+
+    hmetrics = font["hmtx"].metrics
+    upem = font["head"].unitsPerEm
+
+    widths = [hmetrics[names[glyph]][0] for glyph in glyph_order]
+    default_width, nominal_width = optimizeWidths(widths)
+    glyphset = font.getGlyphSet()
+    charstrings = {}
+    for glyph, width in zip(glyph_order, widths):
+        with stage("charstring", names[glyph]):
+            pen = T2CharStringPen(
+                None if width == default_width else width - nominal_width,
+                None)
+            glyphset[names[glyph]].draw(pen)
+            charstrings[glyph] = BoundedCharString(
+                pen.getCharString().program)
+
+    builder = FontBuilder(upem, isTTF=False)
+    builder.setupGlyphOrder(glyph_order)
+    setup_cid_cff(builder, psname, info, max(cids) + 1, charstrings, {
+        "defaultWidthX": default_width,
+        "nominalWidthX": nominal_width,
+    })
+
+    cmapping = {}
+    if unicode_cmap is not None:
+        cmapping = {code: get_glyph_name(cid)
+                    for code, cid in unicode_cmap.items() if cid in cids}
+    uvs = []
+    for base, selector, cid in uvs_sequences:
+        if cid in cids:
+            glyph = get_glyph_name(cid)
+            uvs.append((base, selector,
+                        None if cmapping.get(base) == glyph else glyph))
+    builder.setupCharacterMap(cmapping, uvs=uvs or None)
+    if mac_cmap is not None:
+        subtable = CmapSubtable.newSubtable(2)
+        subtable.platformID = 1
+        subtable.platEncID = 1
+        subtable.language = 0
+        subtable.cmap = {code: get_glyph_name(cid)
+                         for code, cid in mac_cmap.items() if cid in cids}
+        builder.font["cmap"].tables.append(subtable)
+
+    # Side bearings are taken from the bounds rounded outwards
+    builder.setupHorizontalMetrics({
+        glyph: (width, math.floor(charstrings[glyph].bounds[0])
+                if charstrings[glyph].bounds is not None else 0)
+        for glyph, width in zip(glyph_order, widths)
+    })
+    builder.setupHorizontalHeader(ascent=font["hhea"].ascent,
+                                  descent=font["hhea"].descent)
+    vmtx = VMTXFeatureGenerator()
+    vmtx.import_font(font, cidmap)
+    vmtx.write_tables(builder.font, font["VORG"].defaultVertOriginY, bounds={
+        glyph: charstring.bounds for glyph, charstring in charstrings.items()
+    })
+    builder.setupVerticalHeader(tableVersion=0x00011000, caretSlopeRun=1)
+    now = timestampNow()
+    builder.setupHead(unitsPerEm=upem, created=now, modified=now)
+    builder.setupNameTable({})
+    bounds = [charstring.bounds for charstring in charstrings.values()
+              if charstring.bounds is not None]
+    # The underline position of CFF is the center of the line, while that
+    # of post is its top; the strikeout is as thick as the underline
+    topdict = font["CFF "].cff.topDictIndex[0]
+    underline_thickness = topdict.UnderlineThickness
+    underline_position = (topdict.UnderlinePosition +
+                          underline_thickness / 2.0)
+    builder.setupOS2(
+        achVendID=DEFAULT_VENDOR,
+        fsSelection=0x40,
+        ySubscriptXSize=otRound(SUBSCRIPT_X_SIZE * upem),
+        ySubscriptYSize=otRound(SUBSCRIPT_Y_SIZE * upem),
+        ySubscriptYOffset=otRound(SUBSCRIPT_Y_OFFSET * upem),
+        ySuperscriptXSize=otRound(SUPERSCRIPT_X_SIZE * upem),
+        ySuperscriptYSize=otRound(SUPERSCRIPT_Y_SIZE * upem),
+        ySuperscriptYOffset=otRound(SUPERSCRIPT_Y_OFFSET * upem),
+        yStrikeoutSize=otRound(underline_thickness),
+        yStrikeoutPosition=otRound(STRIKEOUT_POSITION * upem),
+        usWinAscent=math.ceil(max(b[3] for b in bounds)),
+        usWinDescent=-math.floor(min(b[1] for b in bounds)),
+        usDefaultChar=0,
+        usBreakChar=0x20,
+        usMaxContext=0,
+    )
+    builder.setupPost(underlinePosition=otRound(underline_position),
+                      underlineThickness=otRound(underline_thickness))
+    builder.setupMaxp()
+    builder.setupDummyDSIG()
+
+    # head, name, OS/2, hhea and vhea are completed by the features
+    with stage("features"):
+        addOpenTypeFeatures(builder.font, featurefile)
+    setup_names(builder.font, psname, menunames)
+
+    os2 = builder.font["OS/2"]
+    os2.recalcAvgCharWidth(builder.font)
+    # The only OS/2 field that differs from the output of makeotf, which
+    # leaves the Unicode ranges of a CID-keyed font empty
+    os2.recalcUnicodeRanges(builder.font)
+    os2.recalcCodePageRanges(builder.font)
+    collection = (info["Registry"], info["Ordering"])
+    if collection in CODE_PAGE_BITS:
+        os2.ulCodePageRange1 |= 1 << CODE_PAGE_BITS[collection]
+    os2.usMaxContext = 1 if "GSUB" in builder.font else 0
+
+    if subroutinize:
+        # Runs the subroutinizer of AFDKO; only needed with --subroutinize
+        import cffsubr  # pylint: disable=import-outside-toplevel
+        with stage("subroutinize"):
+            cffsubr.subroutinize(builder.font)
+    return builder.font
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("infile", help="name-keyed font made by mkotf.py")
+    parser.add_argument("--outfile", "-o", required=True)
+    parser.add_argument("--map", required=True,
+                        help="mergefonts glyph name to CID map")
+    parser.add_argument("--cidfontinfo", required=True)
+    parser.add_argument("--features", required=True)
+    parser.add_argument("--fontmenunamedb", required=True)
+    parser.add_argument("--uvs", default=None,
+                        help="Unicode variation sequences")
+    parser.add_argument("--subroutinize", action="store_true",
+                        help="move shared outline fragments to subroutines "
+                        "(requires cffsubr)")
+    add_profile_argument(parser)
+
+    args = parser.parse_args()
+    setup_profile(args.profile)
+
+    info = parse_cidfontinfo(args.cidfontinfo)
+    collection = (info["Registry"], info["Ordering"])
+    unicode_cmap = mac_cmap = None
+    if collection in CMAPS:
+        unicode_name, mac_name = CMAPS[collection]
+        unicode_cmap = parse_cmap(get_resource_path(*collection, unicode_name))
+        mac_cmap = parse_cmap(get_resource_path(*collection, mac_name))
+    uvs_sequences = []
+    if args.uvs is not None:
+        uvs_sequences = parse_uvs_sequences(args.uvs)
+
+    with stage("build_cid_font"):
+        font = build_cid_font(
+            TTFont(args.infile, lazy=True),
+            parse_map(args.map),
+            info,
+            args.features,
+            parse_fontmenunamedb(args.fontmenunamedb, info["FontName"]),
+            uvs_sequences=uvs_sequences,
+            unicode_cmap=unicode_cmap,
+            mac_cmap=mac_cmap,
+            subroutinize=args.subroutinize,
+        )
+    with stage("save"):
+        font.save(args.outfile)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,129 @@
 #!/usr/bin/env python3
 
-from functools import wraps
-import glob
 import os.path
 import sys
 
-import yaml
+from glyphdb import get_glyphdb
+from primitives import compile_glyph
+from primitives import Use
+from profiling import add_profile_argument
+from profiling import setup_profile
+from profiling import stage
 
 
 def get_dep_glyphs(data):
-    lines = list(data["data"])
+    data = compile_glyph(data)
+    prims = list(data["data"])
     if "keys" in data:
         for key in data["keys"]:
-            lines += key["data"]
+            prims += key["data"]
     glyphs = set()
-    for line in lines:
-        tokens = line.split()
-        if tokens[0] == "use":
-            glyphs.add(tokens[5])
+    for prim in prims:
+        if isinstance(prim, Use):
+            glyphs.add(prim.name)
     return list(glyphs - {data["name"]})
 
 
 def get_dep_map():
-    datadir = os.path.join(os.path.dirname(__file__), "..", "data")
-    filelist = glob.glob(os.path.join(datadir, "*.yaml"))
     depmap = {}
-    for yamlpath in filelist:
-        with open(yamlpath) as yamlfile:
-            data = yaml.safe_load(yamlfile)
-            dep_glyphs = get_dep_glyphs(data)
-            depmap[data["name"]] = dep_glyphs
+    with stage("load_glyphs"):
+        glyphs = list(get_glyphdb().items())
+    for name, data in glyphs:
+        with stage("dep_glyphs", name):
+            depmap[data["name"]] = get_dep_glyphs(data)
     return depmap
 
 
-def memoize(func):
-    memo = {}
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        if args in memo:
-            return memo[args]
-        result = func(*args, **kwargs)
-        memo[args] = result
+class DependencyCycleError(ValueError):
+    pass
+
+
+class DepGraph(object):
+    def __init__(self, depmap):
+        self.depmap = depmap
+        self.rdepmap = {name: [] for name in depmap}
+        for name, deps in depmap.items():
+            for dep in deps:
+                self.rdepmap.setdefault(dep, []).append(name)
+        self._subdeps = {}
+
+    @staticmethod
+    def from_glyphdb():
+        return DepGraph(get_dep_map())
+
+    def update(self, name, deps):
+        # Replaces the dependencies of `name`, which may be a new glyph
+        for dep in self.depmap.get(name, ()):
+            self.rdepmap[dep].remove(name)
+        self.depmap[name] = deps
+        self.rdepmap.setdefault(name, [])
+        for dep in deps:
+            self.rdepmap.setdefault(dep, []).append(name)
+        self._subdeps = {}
+
+    def subdeps(self, name):
+        # All the glyphs that `name` depends on, directly or indirectly
+        if name in self._subdeps:
+            return self._subdeps[name]
+        stack = [(name, iter(self.depmap[name]))]
+        visiting = [name]
+        while stack:
+            current, deps = stack[-1]
+            for dep in deps:
+                if dep in visiting:
+                    cycle = visiting[visiting.index(dep):] + [dep]
+                    raise DependencyCycleError(
+                        "dependency cycle: {0}".format(" -> ".join(cycle)))
+                if dep in self._subdeps:
+                    continue
+                stack.append((dep, iter(self.depmap[dep])))
+                visiting.append(dep)
+                break
+            else:
+                stack.pop()
+                visiting.pop()
+                subdeps = set(self.depmap[current])
+                for dep in self.depmap[current]:
+                    subdeps.update(self._subdeps[dep])
+                self._subdeps[current] = subdeps
+        return self._subdeps[name]
+
+    def rdeps(self, name):
+        # All the glyphs that depend on `name`, directly or indirectly
+        if name not in self.rdepmap:
+            raise KeyError(name)
+        result = set()
+        queue = [name]
+        while queue:
+            for dependent in self.rdepmap[queue.pop()]:
+                if dependent not in result:
+                    result.add(dependent)
+                    queue.append(dependent)
+        if name in result:
+            self.subdeps(name)  # raises DependencyCycleError
         return result
-    return wrapper
 
+    def check_cycles(self):
+        for name in self.depmap:
+            self.subdeps(name)
 
-@memoize
-def sub_dependents(name, depmap):
-    result = set(depmap[name])
-    for dependent in depmap[name]:
-        result.update(sub_dependents(dependent, depmap=depmap))
-    return result
 
-
-def get_dep_list(depmap):
-    for name in depmap.keys():
-        subdep = sub_dependents(name, depmap=depmap)
+def get_dep_list(graph):
+    for name in graph.depmap.keys():
+        subdep = graph.subdeps(name)
         if not subdep:
             continue
         yield "edit/{0}.svg build/expand/{0}.svg : {1}".format(
             name,
             " ".join("data/{0}.yaml".format(dep)
-                     for dep in subdep)
+                     for dep in sorted(subdep))
         )
 
 
-def mkdeps():
-    depmap = get_dep_map()
-    deplist = get_dep_list(depmap)
+def mkdeps(graph=None):
+    if graph is None:
+        graph = DepGraph.from_glyphdb()
+    deplist = get_dep_list(graph)
     header = """\
 # Auto generated from scripts/{0}
 """.format(os.path.basename(__file__))
@@ -78,10 +134,38 @@ def main():
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--outfile", "-o", default=None)
+    parser.add_argument("--deps", metavar="NAME", action="append",
+                        default=[],
+                        help="list the glyphs NAME depends on")
+    parser.add_argument("--rdeps", metavar="NAME", action="append",
+                        default=[],
+                        help="list the glyphs to be rebuilt if NAME changes")
+    add_profile_argument(parser)
 
     args = parser.parse_args()
-
-    depsdata = mkdeps()
+    setup_profile(args.profile)
+
+    with stage("dep_map"):
+        graph = DepGraph.from_glyphdb()
+    glyphdb = get_glyphdb()
+    if os.path.isdir(os.path.dirname(glyphdb.bundlepath)):
+        glyphdb.save()
+
+    if args.deps or args.rdeps:
+        unknown = [name for name in args.deps + args.rdeps
+                   if name not in graph.depmap]
+        if unknown:
+            parser.error("unknown glyph: {0}".format(", ".join(unknown)))
+        names = set()
+        for name in args.deps:
+            names.update(graph.subdeps(name))
+        for name in args.rdeps:
+            names.add(name)
+            names.update(graph.rdeps(name))
+        depsdata = "".join("{0}\n".format(name) for name in sorted(names))
+    else:
+        with stage("mkdeps"):
+            depsdata = mkdeps(graph)
     if args.outfile is None:
         sys.stdout.write(depsdata)
     else:
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+from concurrent.futures import ProcessPoolExecutor
 import glob
 import os.path
 import xml.etree.ElementTree as ET
@@ -7,17 +8,110 @@ import xml.etree.ElementTree as ET
 from fontTools.fontBuilder import FontBuilder
 from fontTools.misc.transform import Identity
 from fontTools.misc.transform import Transform
+from fontTools.pens.recordingPen import RecordingPen
 from fontTools.pens.t2CharStringPen import T2CharStringPen
 from fontTools.pens.transformPen import TransformPen
 from fontTools.svgLib import parse_path
 import yaml
 
 import config  # noqa, pylint: disable=unused-import
+from charstring import BoundedCharString
+from glyphdb import load_file
+from outline import get_bbx_rect
+from outline import get_primitives
+from outline import invert_path
+from outline import OutlineCache
+from outline import set_outline
+from outline import stroke_to_path
+from profiling import add_profile_argument
+from profiling import call_worker
+from profiling import merge_worker
+from profiling import setup_profile
+from profiling import stage
+from util import write_if_changed
+from writesvg import SVGRenderer
 from xmlns import NSMAP
 
 
+ASCENT = 880
+DESCENT = 120
+UPEM = ASCENT + DESCENT
+
+# From the SVGs, 360 units high with y down, to the font space
+FONT_TRANSFORM = Transform(UPEM / 360.0, 0, 0, -UPEM / 360.0, 0, ASCENT)
+
+
+class Outline(object):
+    def __init__(self, name, d, advwidth, advheight, rect=None):
+        self.name = name
+        # SVG path data or an already parsed outline, e.g. pathops.Path
+        self.d = d
+        self.advwidth = advwidth
+        self.advheight = advheight
+        # Only outlines with a bbx_rect are inverted
+        self.rect = rect
+        self._inverted = None
+
+    def inverted(self):
+        if self.rect is None:
+            return self
+        if self._inverted is None:
+            self.set_inverted(invert_path(self.d, self.rect))
+        return self._inverted
+
+    def set_inverted(self, d):
+        self._inverted = Outline(
+            name=self.name,
+            d=d,
+            advwidth=self.advwidth,
+            advheight=self.advheight,
+        )
+
+    @staticmethod
+    def from_svg(svgfile):
+        svg = ET.parse(svgfile).getroot()
+        return Outline(
+            name=svg.get("id"),
+            d=svg.find(".//svg:path", NSMAP).get("d"),
+            advwidth=float(svg.get("width")),
+            advheight=float(svg.get("height")),
+        )
+
+    @staticmethod
+    def from_yaml(yamlfile, renderer, debugdir=None, cache=None):
+        data = load_file(yamlfile)
+        with stage("expand"):
+            svg = renderer.render(data)
+        glyph, elems = get_primitives(svg)
+        outline = Outline(
+            name=data["name"],
+            d=None,
+            advwidth=float(data["width"]),
+            advheight=float(data["height"]),
+            rect=get_bbx_rect(glyph),
+        )
+        with stage("stroke"):
+            if cache is None:
+                outline.d = stroke_to_path(elems, outline.name)
+            else:
+                outline.d, inverted_d = cache.outline(
+                    elems, outline.rect, outline.name)
+                outline.set_inverted(inverted_d)
+
+        if debugdir is not None:
+            filename = "{0}.svg".format(data["name"])
+            set_outline(svg, outline.d)
+            write_if_changed(os.path.join(debugdir, "union", filename),
+                             ET.tostring(svg, encoding="unicode"))
+            set_outline(svg, outline.inverted().d, invert=True)
+            write_if_changed(os.path.join(debugdir, "invert", filename),
+                             ET.tostring(svg, encoding="unicode"))
+        return outline
+
+
 class Glyph(object):
-    def __init__(self, name, d, advwidth, advheight, transform=Identity):
+    def __init__(self, name, d, advwidth, advheight, transform=Identity,
+                 optimize=True):
         self.name = name
 
         advwidth *= abs(transform[0])
@@ -25,57 +119,165 @@ class Glyph(object):
         self.advwidth = advwidth
         self.advheight = advheight
 
-        pen = T2CharStringPen(advwidth, None)
-        tpen = TransformPen(pen, transform)
-        parse_path(d, tpen)
-        self.charstring = pen.getCharString()
+        with stage("charstring", name):
+            pen = T2CharStringPen(advwidth, None)
+            tpen = TransformPen(pen, transform)
+            if isinstance(d, str):
+                parse_path(d, tpen)
+            else:
+                # Already parsed outline, e.g. pathops.Path
+                d.draw(tpen)
+            # Masters of variable fonts are not optimized so that zero-length
+            # segments are kept and the masters stay point compatible
+            self.charstring = BoundedCharString(
+                pen.getCharString(optimize=optimize).program)
 
     def get_hmetrics(self):
-        bounds = self.charstring.calcBounds(None)
+        bounds = self.charstring.bounds
         if bounds is None:
             return (self.advwidth, 0)
         return (int(self.advwidth), int(bounds[0]))
 
     def get_vmetrics(self, ascent):
-        bounds = self.charstring.calcBounds(None)
+        bounds = self.charstring.bounds
         if bounds is None:
             return (self.advheight, ascent)
         return (int(self.advheight), ascent - int(bounds[3]))
 
     @staticmethod
-    def from_svg(svgfile, transform=Identity):
-        svg = ET.parse(svgfile).getroot()
-        name = svg.get("id")
+    def from_outline(outline, transform=Identity):
         return Glyph(
-            name=name,
-            d=svg.find(".//svg:path", NSMAP).get("d"),
-            advwidth=float(svg.get("width")),
-            advheight=float(svg.get("height")),
+            name=outline.name,
+            d=outline.d,
+            advwidth=outline.advwidth,
+            advheight=outline.advheight,
             transform=transform
         )
 
+    @staticmethod
+    def from_svg(svgfile, transform=Identity):
+        return Glyph.from_outline(Outline.from_svg(svgfile), transform)
 
-def collect_glyphs(srcs, **kwargs):
-    glyphs = []
+
+def list_sources(srcs):
+    # SVG and YAML files given or in the directories given, in the order of
+    # the glyphs in the font
+    files = []
     for src in srcs:
         if os.path.isdir(src):
-            files = glob.glob(os.path.join(src, "*.svg"))
+            files.extend(glob.glob(os.path.join(src, "*.svg")) +
+                         glob.glob(os.path.join(src, "*.yaml")))
         else:
-            files = [src]
-        for file in files:
-            glyphs.append(Glyph.from_svg(file, **kwargs))
+            files.append(src)
+    return files
+
+
+def collect_outlines(srcs, debugdir=None, cache=None):
+    outlines = []
+    renderer = SVGRenderer(expand=True)
+    for file in list_sources(srcs):
+        name = os.path.splitext(os.path.basename(file))[0]
+        with stage("outline", name):
+            if file.endswith(".yaml"):
+                outlines.append(Outline.from_yaml(
+                    file, renderer, debugdir=debugdir, cache=cache))
+            else:
+                outlines.append(Outline.from_svg(file))
+    return outlines
+
+
+def get_picklable_outline(outline):
+    # pathops.Path cannot be sent to worker processes; record its drawing
+    if isinstance(outline.d, str):
+        return outline
+    recording = RecordingPen()
+    outline.d.draw(recording)
+    return Outline(outline.name, recording, outline.advwidth,
+                   outline.advheight)
+
+
+def compile_chunk(outlines, transform):
+    return [Glyph.from_outline(outline, transform=transform)
+            for outline in outlines]
+
+
+def compile_glyphs(outlines, transform, jobs=1):
+    if jobs <= 1 or len(outlines) <= 1:
+        return compile_chunk(outlines, transform)
+    outlines = [get_picklable_outline(outline) for outline in outlines]
+    # Interleave so that each worker gets glyphs of every kind
+    chunks = [outlines[i::jobs] for i in range(jobs)]
+    glyphs = [None] * len(outlines)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(call_worker, [compile_chunk] * jobs, chunks,
+                               [transform] * jobs)
+        for i, result in enumerate(results):
+            glyphs[i::jobs] = merge_worker(result)
     return glyphs
 
 
-def build_font(srcs, metadata, filename):
-    ascent = 880
-    descent = 120
-    upem = ascent + descent
-    scale = upem / 360.0
-    transform = Transform(scale, 0, 0, -scale, 0, ascent)
-    glyphs = collect_glyphs(srcs, transform=transform)
+def get_charstring_sizes(font):
+    charstrings = font["CFF "].cff.topDictIndex[0].CharStrings
+    sizes = {}
+    for name in font.getGlyphOrder():
+        charstring = charstrings[name]
+        charstring.compile()
+        sizes[name] = len(charstring.bytecode)
+    return sizes
+
+
+def get_subrs_size(font):
+    cff = font["CFF "].cff
+    subrs = list(cff.GlobalSubrs)
+    private = cff.topDictIndex[0].Private
+    if hasattr(private, "Subrs"):
+        subrs.extend(private.Subrs)
+    size = 0
+    for subr in subrs:
+        subr.compile()
+        size += len(subr.bytecode)
+    return size
+
 
-    builder = FontBuilder(1000, isTTF=False)
+def write_size_report(reportfile, sizes, subr_sizes, subrs_size):
+    with open(reportfile, "w") as report:
+        report.write("glyph\traw\tsubroutinized\n")
+        for name, size in sizes.items():
+            report.write("{0}\t{1}\t{2}\n".format(
+                name, size, subr_sizes[name]))
+        report.write("(subrs)\t0\t{0}\n".format(subrs_size))
+        report.write("(total)\t{0}\t{1}\n".format(
+            sum(sizes.values()), sum(subr_sizes.values()) + subrs_size))
+
+
+def build_fonts(srcs, fonts, debugdir=None, cachefile=None, jobs=1,
+                subroutinize=False, size_report=False):
+    cache = None if cachefile is None else OutlineCache(cachefile)
+    with stage("collect_outlines"):
+        outlines = collect_outlines(srcs, debugdir=debugdir, cache=cache)
+    if cache is not None:
+        cache.save()
+    for metadata, filename, invert in fonts:
+        if invert:
+            with stage("invert"):
+                font_outlines = [outline.inverted() for outline in outlines]
+        else:
+            font_outlines = outlines
+        write_font(font_outlines, metadata, filename, jobs=jobs,
+                   subroutinize=subroutinize, size_report=size_report)
+
+
+def build_font(srcs, metadata, filename, invert=False, debugdir=None,
+               jobs=1, subroutinize=False, size_report=False):
+    build_fonts(srcs, [(metadata, filename, invert)], debugdir=debugdir,
+                jobs=jobs, subroutinize=subroutinize,
+                size_report=size_report)
+
+
+def setup_font(glyphs, metadata):
+    # Font with the compiled glyphs and the metrics; only the cmap of
+    # .notdef is set up
+    builder = FontBuilder(UPEM, isTTF=False)
     builder.setupGlyphOrder([glyph.name for glyph in glyphs])
     builder.setupCharacterMap({0: ".notdef"})
     psname = metadata["psName"]
@@ -92,17 +294,45 @@ def build_font(srcs, metadata, filename):
         glyph.name: glyph.get_hmetrics()
         for glyph in glyphs
     })
-    builder.setupHorizontalHeader(ascent=ascent, descent=-descent)
+    builder.setupHorizontalHeader(ascent=ASCENT, descent=-DESCENT)
     builder.setupNameTable({})
     builder.setupOS2()
     builder.setupPost()
     builder.setupVerticalMetrics({
-        glyph.name: glyph.get_vmetrics(ascent=ascent)
+        glyph.name: glyph.get_vmetrics(ascent=ASCENT)
         for glyph in glyphs
     })
-    builder.setupVerticalOrigins({}, ascent)
-    builder.setupVerticalHeader(ascent=ascent, descent=-descent)
-    builder.save(filename)
+    builder.setupVerticalOrigins({}, ASCENT)
+    builder.setupVerticalHeader(ascent=ASCENT, descent=-DESCENT)
+    return builder
+
+
+def write_font(outlines, metadata, filename, jobs=1, subroutinize=False,
+               size_report=False):
+    with stage("compile_glyphs"):
+        glyphs = compile_glyphs(outlines, FONT_TRANSFORM, jobs=jobs)
+
+    builder = setup_font(glyphs, metadata)
+    # The charstrings are already specialized by T2CharStringPen; shared
+    # outline fragments (components) are moved into subroutines here
+    if subroutinize or size_report:
+        sizes = get_charstring_sizes(builder.font)
+    if subroutinize:
+        # Runs the subroutinizer of AFDKO; only needed with --subroutinize
+        import cffsubr  # pylint: disable=import-outside-toplevel
+        with stage("subroutinize"):
+            cffsubr.subroutinize(builder.font)
+    if size_report:
+        if subroutinize:
+            subr_sizes = get_charstring_sizes(builder.font)
+            subrs_size = get_subrs_size(builder.font)
+        else:
+            subr_sizes = sizes
+            subrs_size = 0
+        write_size_report(filename + ".sizes.tsv", sizes, subr_sizes,
+                          subrs_size)
+    with stage("save"):
+        builder.save(filename)
 
 
 def main():
@@ -111,11 +341,48 @@ def main():
     parser.add_argument("src", nargs="+")
     parser.add_argument("--meta", "-m", type=argparse.FileType("r"))
     parser.add_argument("--outfile", "-o", required=True)
+    parser.add_argument("--jobs", "-j", type=int, default=1)
+
+    parser.add_argument("--invert", action="store_true",
+                        help="subtract glyphs read from YAML from their "
+                        "bbx_rect")
+    parser.add_argument("--invert-meta", type=argparse.FileType("r"),
+                        help="metadata of the inverted font to be built "
+                        "in the same run")
+    parser.add_argument("--invert-outfile", default=None,
+                        help="output of the inverted font to be built "
+                        "in the same run")
+    parser.add_argument("--debug-svg", metavar="DIR", default=None,
+                        help="write the outlined SVGs of glyphs read from "
+                        "YAML to DIR/union and DIR/invert")
+    parser.add_argument("--cache", metavar="FILE", default=None,
+                        help="reuse outlines of unchanged geometry stored "
+                        "in FILE")
+    parser.add_argument("--subroutinize", action="store_true",
+                        help="move shared outline fragments to subroutines "
+                        "(requires cffsubr)")
+    parser.add_argument("--size-report", action="store_true",
+                        help="write the charstring size of each glyph to "
+                        "OUTFILE.sizes.tsv")
+    add_profile_argument(parser)
 
     args = parser.parse_args()
+    setup_profile(args.profile)
+
+    if (args.invert_meta is None) != (args.invert_outfile is None):
+        parser.error("--invert-meta and --invert-outfile must be "
+                     "given together")
 
-    metadata = yaml.safe_load(args.meta)
-    build_font(args.src, metadata, args.outfile)
+    fonts = [(yaml.safe_load(args.meta), args.outfile, args.invert)]
+    if args.invert_outfile is not None:
+        fonts.append(
+            (yaml.safe_load(args.invert_meta), args.invert_outfile, True))
+    if args.debug_svg is not None:
+        os.makedirs(os.path.join(args.debug_svg, "union"), exist_ok=True)
+        os.makedirs(os.path.join(args.debug_svg, "invert"), exist_ok=True)
+    build_fonts(args.src, fonts, debugdir=args.debug_svg,
+                cachefile=args.cache, jobs=args.jobs,
+                subroutinize=args.subroutinize, size_report=args.size_report)
 
 
 if __name__ == "__main__":
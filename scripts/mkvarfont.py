@@ -0,0 +1,697 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ProcessPoolExecutor
+import math
+import re
+import sys
+
+from fontTools.designspaceLib import AxisDescriptor
+from fontTools.designspaceLib import DesignSpaceDocument
+from fontTools.designspaceLib import SourceDescriptor
+from fontTools.feaLib.builder import addOpenTypeFeaturesFromString
+from fontTools.fontBuilder import FontBuilder
+from fontTools.misc.bezierTools import splitCubicAtT
+from fontTools.pens.recordingPen import RecordingPen
+from fontTools import varLib
+import numpy as np
+import yaml
+
+import config  # noqa, pylint: disable=unused-import
+from glyphdb import load_file
+from keyarray import InterpolateError
+from mkotf import collect_outlines
+from mkotf import FONT_TRANSFORM
+from mkotf import Glyph
+from mkotf import list_sources
+from mkotf import setup_font
+from outline import get_primitives
+from outline import get_rect
+from outline import OutlineCache
+from outline import STROKE_WIDTH
+from pathdata import PathData
+from pathdata import POINT_COUNTS
+from profiling import add_profile_argument
+from profiling import call_worker
+from profiling import merge_worker
+from profiling import setup_profile
+from profiling import stage
+from writesvg import get_resized_record
+from writesvg import schedule_files
+from writesvg import SVGRenderer
+from xmlns import SVG_NS
+
+
+# Distance of the control points of a quarter circle from its ends
+KAPPA = 4.0 * (math.sqrt(2.0) - 1.0) / 3.0
+
+RADIUS = STROKE_WIDTH / 2.0
+
+# Width axis in percent of the width of the glyph
+AXIS_TAG = "wdth"
+AXIS_NAME = "Width"
+AXIS_DEFAULT = 100.0
+
+# Maximum distance (in the units of the SVGs) between the outline of a
+# glyph and that interpolated from the masters around it, except where the
+# keys jump between two positions masters can be placed at
+TOLERANCE = 1.0
+
+# Number of pieces each curve is split into before stroking. The sides of
+# a stroked piece are single offset curves; those of circular arcs stay
+# on the offset circles (see --check-stroker), but those of curves whose
+# curvature changes, such as quadratic Béziers, only follow the offsets
+# of the centerline if the pieces are short
+CURVE_PIECES = 4
+
+# Maximum distance (in the units of the SVGs) of the stroked sides of a
+# circular arc from the offset circles, beyond that of the arc itself
+ARC_CHECK_TOLERANCE = 0.05
+
+# Glyphs named after a code point, e.g. u3041, and their vertical forms
+UNICODE_NAME_RE = re.compile(r"^u([0-9a-f]{4,6})$")
+VERT_SUFFIX = ".vert"
+
+# Interval on the axis at which glyphs are sampled to place the masters
+STEP = 100.0 / 64
+
+# Interval on the axis, in samples, of the positions the masters can be
+# placed at besides the ends. The glyphs share these positions, and so
+# the variation regions between them, each of which takes space in the
+# font; a jump of the keys is spread over the interval around it.
+MASTER_STRIDE = 8
+
+
+def _sub(p, q):
+    return (p[0] - q[0], p[1] - q[1])
+
+
+def _direction(*vectors):
+    for dx, dy in vectors:
+        length = math.hypot(dx, dy)
+        if length > 1e-9:
+            return (dx / length, dy / length)
+    # Zero-length segments are stroked as a dot
+    return (1.0, 0.0)
+
+
+def _cross(a, b):
+    return a[0] * b[1] - a[1] * b[0]
+
+
+def _curvature(tangent, next_leg):
+    # Signed curvature at the start of a cubic Bézier whose first control
+    # leg is `tangent` and second is `next_leg`
+    length = math.hypot(*tangent)
+    if length < 1e-9:
+        return 0.0
+    return 2.0 / 3.0 * _cross(tangent, next_leg) / length ** 3
+
+
+def _offset(point, normal, distance):
+    return (point[0] + normal[0] * distance, point[1] + normal[1] * distance)
+
+
+def _handle(start, leg, scale):
+    # Control point at `leg` scaled from the end point `start`
+    scale = min(max(scale, 0.0), 2.0)
+    return (start[0] + leg[0] * scale, start[1] + leg[1] * scale)
+
+
+def _cap(pen, center, normal, direction):
+    # Half circle around center from the side of normal to the opposite
+    # side, through the side of direction
+    r = RADIUS
+    k = KAPPA * r
+    cx, cy = center
+    nx, ny = normal
+    dx, dy = direction
+    pen.curveTo((cx + r * nx + k * dx, cy + r * ny + k * dy),
+                (cx + r * dx + k * nx, cy + r * dy + k * ny),
+                (cx + r * dx, cy + r * dy))
+    pen.curveTo((cx + r * dx - k * nx, cy + r * dy - k * ny),
+                (cx - r * nx + k * dx, cy - r * ny + k * dy),
+                (cx - r * nx, cy - r * ny))
+
+
+def _frame(points, tangent=None):
+    # Directions at both ends of a line (two points) or a cubic Bézier
+    # (four points) and the curvatures there; zero-length segments take
+    # `tangent`, the direction at the end of the previous segment
+    p0 = points[0]
+    p3 = points[-1]
+    if len(points) == 2:
+        d0 = d3 = _direction(_sub(p3, p0), tangent or (1.0, 0.0))
+        return d0, d3, 0.0, 0.0
+    p1, p2 = points[1], points[2]
+    leg0 = _sub(p1, p0)
+    leg2 = _sub(p3, p2)
+    d0 = _direction(leg0, _sub(p2, p0), _sub(p3, p0), tangent or (1.0, 0.0))
+    d3 = _direction(leg2, _sub(p3, p1), _sub(p3, p0), d0)
+    k0 = _curvature(leg0, _sub(p2, p1))
+    # Curvature of the reversed curve at its start, which has the opposite
+    # sign
+    k3 = -_curvature(_sub(p2, p3), _sub(p1, p2))
+    return d0, d3, k0, k3
+
+
+def _normal(direction):
+    return (-direction[1], direction[0])
+
+
+def _offset_segment(points, frame, r):
+    # Side of the stroke of a segment at the signed distance r, as its
+    # start and the points of a line or a curve from there. The sides of
+    # a curve are approximated by offsetting its ends and scaling its
+    # control legs by the curvature.
+    d0, d3, k0, k3 = frame
+    start = _offset(points[0], _normal(d0), r)
+    end = _offset(points[-1], _normal(d3), r)
+    if len(points) == 2:
+        return start, [end]
+    return start, [_handle(start, _sub(points[1], points[0]), 1.0 - r * k0),
+                   _handle(end, _sub(points[2], points[3]), 1.0 - r * k3),
+                   end]
+
+
+def _join(center, d0, d1, r):
+    # Arc of radius |r| around the joint of two segments from the side of
+    # the first at the signed distance r to that of the second, as the
+    # points of a curve. It is drawn on the inner side of the turn as
+    # well, where it lies inside the strokes, so that the contour does not
+    # depend on the direction of the turn.
+    angle = math.atan2(_cross(d0, d1), d0[0] * d1[0] + d0[1] * d1[1])
+    k = 4.0 / 3.0 * math.tan(angle / 4.0) * r
+    start = _offset(center, _normal(d0), r)
+    end = _offset(center, _normal(d1), r)
+    return [_offset(start, d0, -k), _offset(end, d1, k), end]
+
+
+def _draw(pen, side):
+    for points in side:
+        if len(points) == 1:
+            pen.lineTo(points[0])
+        else:
+            pen.curveTo(*points)
+
+
+def _reverse(start, side):
+    # The same line and curves drawn from the end to `start`
+    reverse = []
+    for i in range(len(side) - 1, -1, -1):
+        previous = side[i - 1][-1] if i > 0 else start
+        reverse.append(side[i][-2::-1] + [previous])
+    return reverse
+
+
+def stroke_subpath(pen, segments, closed):
+    # Draws the stroke of connected segments with round joins, and round
+    # caps at the ends unless closed, as one contour, or as two contours
+    # of opposite directions if closed. `segments` are pairs of the points
+    # of a line or a cubic Bézier and whether they continue the previous
+    # segment smoothly, as the pieces of a split curve do. The contours
+    # only depend on the kinds of the segments, so that the strokes of
+    # paths of the same kinds are point compatible; overlaps are united by
+    # the non-zero fill rule.
+    frames = []
+    tangent = None
+    for points, _smooth in segments:
+        frames.append(_frame(points, tangent))
+        tangent = frames[-1][1]
+    sides = []
+    for r in (RADIUS, -RADIUS):
+        start = side = None
+        for i, (points, smooth) in enumerate(segments):
+            begin, offset = _offset_segment(points, frames[i], r)
+            if i == 0:
+                start, side = begin, []
+            elif not smooth:
+                side.append(_join(points[0], frames[i - 1][1],
+                                  frames[i][0], r))
+            side.append(offset)
+        if closed:
+            side.append(_join(segments[0][0][0], frames[-1][1],
+                              frames[0][0], r))
+        sides.append((start, side))
+    (start, left), (end, right) = sides
+    # Same orientation as the outlines of stroke_to_path, which is
+    # counter-clockwise in the font
+    pen.moveTo(start)
+    _draw(pen, left)
+    if closed:
+        pen.closePath()
+        pen.moveTo(end)
+        _draw(pen, _reverse(end, right))
+        pen.closePath()
+        return
+    d3 = frames[-1][1]
+    _cap(pen, segments[-1][0][-1], _normal(d3), d3)
+    _draw(pen, _reverse(end, right))
+    d0 = frames[0][0]
+    _cap(pen, segments[0][0][0], _normal((-d0[0], -d0[1])),
+         (-d0[0], -d0[1]))
+    pen.closePath()
+
+
+def split_curve(points):
+    # Splits a cubic Bézier into CURVE_PIECES pieces of equal parameter
+    # ranges
+    return [list(piece) for piece in splitCubicAtT(*points, *[
+        i / float(CURVE_PIECES) for i in range(1, CURVE_PIECES)])]
+
+
+def stroke_path(pen, path):
+    # Strokes each subpath of a PathData; closing segments are stroked
+    # even if they are zero-length so that the contours do not depend on
+    # the coordinates
+    coords = path.coords
+    offset = 0
+    start = current = None
+    segments = []
+    for op in path.ops:
+        count = POINT_COUNTS[op]
+        points = [(coords[offset + 2 * i], coords[offset + 2 * i + 1])
+                  for i in range(count)]
+        offset += 2 * count
+        if op == "M":
+            if segments:
+                stroke_subpath(pen, segments, False)
+                segments = []
+            start = current = points[0]
+        elif op == "L":
+            segments.append(([current, points[0]], False))
+            current = points[0]
+        elif op in ("Q", "C"):
+            if op == "Q":
+                # Degree elevation
+                control, end = points
+                points = [
+                    (current[0] + 2.0 / 3.0 * (control[0] - current[0]),
+                     current[1] + 2.0 / 3.0 * (control[1] - current[1])),
+                    (end[0] + 2.0 / 3.0 * (control[0] - end[0]),
+                     end[1] + 2.0 / 3.0 * (control[1] - end[1])),
+                    end]
+            pieces = split_curve([current] + points)
+            segments.extend((piece, i > 0) for i, piece in enumerate(pieces))
+            current = points[-1]
+        elif op == "Z":
+            segments.append(([current, start], False))
+            stroke_subpath(pen, segments, True)
+            segments = []
+            current = start
+    if segments:
+        stroke_subpath(pen, segments, False)
+
+
+def get_arc_offset_error(radius, sweep):
+    # Largest distance between the sides of the stroke of a circular arc of
+    # `sweep` radians, drawn as a single cubic Bézier around the origin,
+    # and the circles of radius radius +- RADIUS
+    k = 4.0 / 3.0 * math.tan(sweep / 4.0) * radius
+    cos_s = math.cos(sweep)
+    sin_s = math.sin(sweep)
+    points = [(radius, 0.0), (radius, k),
+              (radius * cos_s + k * sin_s, radius * sin_s - k * cos_s),
+              (radius * cos_s, radius * sin_s)]
+    t = np.linspace(0.0, 1.0, 33)[:, None]
+    bernstein = np.hstack([(1 - t) ** 3, 3 * (1 - t) ** 2 * t,
+                           3 * (1 - t) * t ** 2, t ** 3])
+    recording = RecordingPen()
+    stroke_path(recording, PathData("MC", [c for p in points for c in p]))
+    # The contour is the pieces of a side, a cap of two curves, the pieces
+    # of the other side and the other cap
+    value = recording.value
+    error = 0.0
+    for i in (list(range(1, CURVE_PIECES + 1)) +
+              list(range(CURVE_PIECES + 3, 2 * CURVE_PIECES + 3))):
+        start = value[i - 1][1][-1]
+        side = value[i][1]
+        distance = np.hypot(*(bernstein @ np.array((start,) + side)).T)
+        expected = radius + math.copysign(
+            RADIUS, math.hypot(*start) - radius)
+        error = max(error, float(np.abs(distance - expected).max()))
+    return error
+
+
+def check_stroker():
+    # Arcs are lowered to cubic Béziers of at most a quarter circle, and
+    # glyphs are normalized to 360 units
+    failed = False
+    for radius in (RADIUS + 1.0, 2.0 * RADIUS, 30.0, 90.0, 180.0):
+        for degrees in (30, 60, 90):
+            error = get_arc_offset_error(radius, math.radians(degrees))
+            # The cubic itself is off the circle by up to 2.7e-4 * radius
+            ok = error <= ARC_CHECK_TOLERANCE + 2.8e-4 * (radius + RADIUS)
+            failed = failed or not ok
+            print("radius {0:6.2f} sweep {1:3d}: {2:.4f}{3}".format(
+                radius, degrees, error, "" if ok else " too far"))
+    return "the stroker is off the circles" if failed else None
+
+
+def get_pathdata(elem):
+    if elem.tag == SVG_NS + "rect":
+        x, y, width, height = get_rect(elem)
+        return PathData("MLLLZ", [x, y, x + width, y, x + width,
+                                  y + height, x, y + height])
+    return PathData.parse(elem.get("d"))
+
+
+class Skeleton(object):
+    # Primitives of a glyph expanded at one width and their stroked
+    # outline, which has the same points for primitives with the same
+    # kinds of segments
+    __slots__ = ("paths", "ops", "_outline")
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.ops = tuple(path.ops for path in paths)
+        self._outline = None
+
+    def get_outline(self):
+        if self._outline is None:
+            self._outline = RecordingPen()
+            for path in self.paths:
+                stroke_path(self._outline, path)
+        return self._outline
+
+    def get_coords(self):
+        return np.array([value for _operator, points in
+                         self.get_outline().value
+                         for point in points for value in point])
+
+
+class GlyphSampler(object):
+    # Expands a glyph at positions on the width axis and finds the
+    # positions between which its primitives change linearly
+
+    def __init__(self, data, renderer, tolerance=TOLERANCE, step=STEP,
+                 stride=MASTER_STRIDE):
+        self.data = data
+        self.renderer = renderer
+        self.tolerance = tolerance
+        self.step = step
+        self.stride = stride
+        self.samples = {}
+
+    def get_width(self, value):
+        return self.data["width"] * value / AXIS_DEFAULT
+
+    def sample(self, value):
+        skeleton = self.samples.get(value)
+        if skeleton is None:
+            record = get_resized_record(
+                self.data["name"], self.data, self.get_width(value),
+                self.data["height"])
+            _glyph, elems = get_primitives(self.renderer.render(record))
+            skeleton = Skeleton([get_pathdata(elem) for elem in elems])
+            self.samples[value] = skeleton
+        return skeleton
+
+    def find_masters(self, minimum, maximum):
+        # Positions on the axis, including the default and the ends,
+        # between which the primitives are interpolated within the
+        # tolerance. The glyph is sampled on a grid and the fewest of
+        # every stride-th sample are kept as in the Douglas-Peucker
+        # algorithm. Raises InterpolateError if the keys cannot be
+        # interpolated anywhere in the range or the primitives change.
+        default = self.sample(AXIS_DEFAULT)
+        masters = [AXIS_DEFAULT]
+        for end in (minimum, maximum):
+            if end == AXIS_DEFAULT:
+                continue
+            count = max(1, int(math.ceil(abs(end - AXIS_DEFAULT) /
+                                         self.step)))
+            values = [AXIS_DEFAULT + (end - AXIS_DEFAULT) * i / count
+                      for i in range(count + 1)]
+            skeletons = [self.sample(value) for value in values]
+            if any(skeleton.ops != default.ops for skeleton in skeletons):
+                raise InterpolateError("primitives change along the axis")
+            # The stroker is not linear in the primitives, so the outlines
+            # are compared rather than the primitives
+            coords = np.array([skeleton.get_coords()
+                               for skeleton in skeletons])
+            masters.extend(values[i] for i in self.simplify(coords))
+        return sorted(masters)
+
+    def simplify(self, coords):
+        # Indices of the rows of coords, including the last one, that are
+        # needed to interpolate the others within the tolerance. Ranges
+        # are split at the multiple of the stride nearest to the worst
+        # row; those without one inside are kept as they are.
+        kept = [len(coords) - 1]
+        ranges = [(0, len(coords) - 1)]
+        while ranges:
+            first, last = ranges.pop()
+            if last - first < 2 or not coords.shape[1]:
+                continue
+            t = (np.arange(first + 1, last) - first) / float(last - first)
+            expected = (coords[first] +
+                        (coords[last] - coords[first]) * t[:, None])
+            errors = np.abs(coords[first + 1:last] - expected).max(axis=1)
+            worst = int(errors.argmax())
+            if errors[worst] <= self.tolerance:
+                continue
+            middle = first + 1 + worst
+            lower = (first // self.stride + 1) * self.stride
+            upper = (last - 1) // self.stride * self.stride
+            if lower > upper:
+                continue
+            middle = int(round(middle / float(self.stride))) * self.stride
+            middle = min(max(middle, lower), upper)
+            kept.append(middle)
+            ranges.append((first, middle))
+            ranges.append((middle, last))
+        return sorted(kept)
+
+
+class VariableGlyph(object):
+    def __init__(self, name, advwidth, advheight, masters=None, reason=None):
+        self.name = name
+        self.advwidth = advwidth
+        self.advheight = advheight
+        # Position on the axis -> outline (RecordingPen); None if the glyph
+        # falls back to the static outline for `reason`
+        self.masters = masters
+        self.reason = reason
+
+    def get_advwidth(self, value):
+        return self.advwidth * value / AXIS_DEFAULT
+
+    def get_glyph(self, value):
+        # Glyph of a master font; glyphs without a master there are empty,
+        # which varLib takes as missing from a sparse master
+        recording = self.masters.get(value)
+        if recording is None:
+            recording = RecordingPen()
+        return Glyph(self.name, recording, self.get_advwidth(value),
+                     self.advheight, FONT_TRANSFORM, optimize=False)
+
+
+def sample_glyph(yamlfile, renderer, minimum, maximum, tolerance):
+    data = load_file(yamlfile)
+    name = data["name"]
+    glyph = VariableGlyph(name, float(data["width"]), float(data["height"]))
+    sampler = GlyphSampler(data, renderer, tolerance=tolerance)
+    with stage("sample", name):
+        try:
+            values = sampler.find_masters(minimum, maximum)
+        except InterpolateError as exc:
+            glyph.reason = str(exc)
+            return glyph
+    glyph.masters = {value: sampler.sample(value).get_outline()
+                     for value in values}
+    return glyph
+
+
+def sample_chunk(yamlfiles, minimum, maximum, tolerance):
+    renderer = SVGRenderer(expand=True)
+    return [sample_glyph(yamlfile, renderer, minimum, maximum, tolerance)
+            for yamlfile in yamlfiles]
+
+
+def sample_glyphs(yamlfiles, minimum, maximum, tolerance, jobs=1):
+    # Returns the VariableGlyph of each file
+    if jobs <= 1 or len(yamlfiles) <= 1:
+        chunks = [yamlfiles]
+        results = [sample_chunk(yamlfiles, minimum, maximum, tolerance)]
+    else:
+        chunks = schedule_files(yamlfiles, jobs)
+        count = len(chunks)
+        with ProcessPoolExecutor(max_workers=count) as executor:
+            results = [merge_worker(result) for result in executor.map(
+                call_worker, [sample_chunk] * count, chunks,
+                [minimum] * count, [maximum] * count, [tolerance] * count)]
+    glyphs = {}
+    for chunk, result in zip(chunks, results):
+        glyphs.update(zip(chunk, result))
+    return glyphs
+
+
+def get_static_glyph(outline, value):
+    # Static glyphs are only drawn in the default master
+    if value == AXIS_DEFAULT:
+        return Glyph.from_outline(outline, FONT_TRANSFORM)
+    return Glyph(outline.name, RecordingPen(), outline.advwidth,
+                 outline.advheight, FONT_TRANSFORM)
+
+
+def get_unicode_cmap(names):
+    cmap = {}
+    for name in names:
+        match = UNICODE_NAME_RE.match(name)
+        if match is not None:
+            cmap[int(match.group(1), 16)] = name
+    return cmap
+
+
+def get_vert_features(names):
+    # Substitutes the vertical forms of the glyphs named NAME.vert
+    names = set(names)
+    subs = ["    sub {0} by {1};".format(name[:-len(VERT_SUFFIX)], name)
+            for name in sorted(names) if name.endswith(VERT_SUFFIX) and
+            name[:-len(VERT_SUFFIX)] in names]
+    if not subs:
+        return None
+    lookup = "lookup vertForms {{\n{0}\n}} vertForms;".format("\n".join(subs))
+    return "\n".join([
+        "languagesystem DFLT dflt;",
+        lookup,
+        "feature vert { lookup vertForms; } vert;",
+        "feature vrt2 { lookup vertForms; } vrt2;",
+    ]) + "\n"
+
+
+def build_designspace(entries, metadata, minimum, maximum):
+    values = {AXIS_DEFAULT, minimum, maximum}
+    for entry in entries:
+        if isinstance(entry, VariableGlyph):
+            values.update(entry.masters)
+
+    doc = DesignSpaceDocument()
+    axis = AxisDescriptor()
+    axis.tag = AXIS_TAG
+    axis.name = AXIS_NAME
+    axis.minimum = minimum
+    axis.default = AXIS_DEFAULT
+    axis.maximum = maximum
+    doc.addAxis(axis)
+    for value in sorted(values):
+        glyphs = [
+            entry.get_glyph(value) if isinstance(entry, VariableGlyph)
+            else get_static_glyph(entry, value)
+            for entry in entries
+        ]
+        builder = setup_font(glyphs, metadata)
+        if value == AXIS_DEFAULT:
+            psname = metadata["psName"]
+            builder.setupNameTable({
+                "familyName": psname.split("-")[0],
+                "styleName": "Regular",
+                "psName": psname,
+            })
+        source = SourceDescriptor()
+        source.name = "{0}".format(value)
+        source.font = builder.font
+        source.location = {AXIS_NAME: value}
+        doc.addSource(source)
+    return doc
+
+
+def write_master_report(reportfile, entries, variable):
+    # Masters of each glyph, or why it keeps its static outline
+    with open(reportfile, "w") as report:
+        report.write("glyph\tmasters\tnote\n")
+        for file, entry in entries:
+            glyph = variable.get(file)
+            if glyph is None:
+                report.write("{0}\t\tstatic\n".format(entry.name))
+            elif glyph.masters is None:
+                report.write("{0}\t\t{1}\n".format(glyph.name, glyph.reason))
+            else:
+                report.write("{0}\t{1}\t\n".format(glyph.name, " ".join(
+                    "{0:g}".format(value) for value in sorted(glyph.masters))))
+
+
+def build_variable_font(srcs, metadata, filename, minimum, maximum,
+                        tolerance=TOLERANCE, cachefile=None, jobs=1,
+                        master_report=False):
+    files = list_sources(srcs)
+    yamlfiles = [file for file in files if file.endswith(".yaml")]
+    with stage("sample_glyphs"):
+        variable = sample_glyphs(yamlfiles, minimum, maximum, tolerance,
+                                 jobs=jobs)
+
+    # Glyphs read from SVG and those whose keys cannot be interpolated on
+    # the whole axis keep the outlines of the static font
+    static_files = [file for file in files
+                    if file not in variable or variable[file].masters is None]
+    cache = None if cachefile is None else OutlineCache(cachefile)
+    with stage("collect_outlines"):
+        static = dict(zip(static_files,
+                          collect_outlines(static_files, cache=cache)))
+    if cache is not None:
+        cache.save()
+    entries = [(file, static[file] if file in static else variable[file])
+               for file in files]
+
+    with stage("build_masters"):
+        doc = build_designspace([entry for _file, entry in entries],
+                                metadata, minimum, maximum)
+    with stage("merge"):
+        font, _model, _masters = varLib.build(doc)
+    names = [entry.name for _file, entry in entries]
+    FontBuilder(font=font).setupCharacterMap(get_unicode_cmap(names))
+    features = get_vert_features(names)
+    if features is not None:
+        addOpenTypeFeaturesFromString(font, features)
+    with stage("save"):
+        font.save(filename)
+    if master_report:
+        write_master_report(filename + ".masters.tsv", entries, variable)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        fromfile_prefix_chars='@',
+        description="build a CFF2 variable font whose width axis "
+        "interpolates the keys of the glyphs")
+    parser.add_argument("src", nargs="*")
+    parser.add_argument("--meta", "-m", type=argparse.FileType("r"))
+    parser.add_argument("--outfile", "-o")
+    parser.add_argument("--jobs", "-j", type=int, default=1)
+    parser.add_argument("--min", type=float, default=50.0,
+                        help="minimum of the width axis in percent")
+    parser.add_argument("--max", type=float, default=150.0,
+                        help="maximum of the width axis in percent")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="maximum error of the interpolated primitives "
+                        "in units of the SVGs")
+    parser.add_argument("--cache", metavar="FILE", default=None,
+                        help="reuse outlines of unchanged geometry stored "
+                        "in FILE")
+    parser.add_argument("--master-report", action="store_true",
+                        help="write the masters of each glyph, or why it "
+                        "is static, to OUTFILE.masters.tsv")
+    parser.add_argument("--check-stroker", action="store_true",
+                        help="check that the stroked sides of circular arcs "
+                        "stay at their radius +- the stroke radius, instead "
+                        "of building the font")
+    add_profile_argument(parser)
+
+    args = parser.parse_args()
+    setup_profile(args.profile)
+
+    if args.check_stroker:
+        sys.exit(check_stroker())
+    if not args.src or args.meta is None or args.outfile is None:
+        parser.error("sources, --meta and --outfile are required")
+    if not args.min <= AXIS_DEFAULT <= args.max or args.min <= 0:
+        parser.error("the axis must include {0:g}".format(AXIS_DEFAULT))
+    build_variable_font(args.src, yaml.safe_load(args.meta), args.outfile,
+                        args.min, args.max, tolerance=args.tolerance,
+                        cachefile=args.cache, jobs=args.jobs,
+                        master_report=args.master_report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,36 @@
 #!/usr/bin/env python3
 
 from collections import defaultdict
+import math
 import sys
 
+from fontTools.ttLib import newTable
 from fontTools.ttLib import TTFont
 
+from profiling import add_profile_argument
+from profiling import setup_profile
+from profiling import stage
+
+
+def get_glyph_name(cid):
+    if cid == 0:
+        return ".notdef"
+    return "cid{0:05d}".format(cid)
+
+
+def get_cid(glyph_name):
+    if glyph_name == ".notdef":
+        return 0
+    return int(glyph_name[len("cid"):])
+
 
 class VMTXFeatureGenerator(object):
     def __init__(self):
+        # CID -> (vertical advance, vertical origin); None means the default
         self.mtx = {}
 
     def import_font(self, font, cidmap):
+        # Only head, vmtx and VORG are read, so the font may be lazily loaded
         upem = font["head"].unitsPerEm
         vmetrics = font["vmtx"].metrics
         vorgrecs = font["VORG"].VOriginRecords
@@ -27,6 +47,49 @@ class VMTXFeatureGenerator(object):
             for cid in cids:
                 self.mtx[cid] = (vadv, vorg)
 
+    def import_file(self, fontfile, cidmap):
+        with stage("import_font"):
+            self.import_font(TTFont(fontfile, lazy=True), cidmap)
+
+    def get_metrics(self):
+        return dict(self.mtx)
+
+    def write_tables(self, font, default_vorg, bounds=None):
+        # Sets vmtx and VORG of the CID-keyed font. bounds maps glyph names
+        # to their bounds and is computed from the charstrings if omitted.
+        upem = font["head"].unitsPerEm
+        glyph_order = font.getGlyphOrder()
+        if bounds is None:
+            charstrings = font["CFF "].cff.topDictIndex[0].CharStrings
+            bounds = {
+                name: charstrings[name].calcBounds(charstrings)
+                for name in glyph_order
+            }
+        metrics = {}
+        vorigins = {}
+        for name in glyph_order:
+            vadv, vorg = self.mtx.get(get_cid(name), (None, None))
+            if vorg is None:
+                vorg = default_vorg
+            else:
+                vorigins[name] = vorg
+            if vadv is None:
+                vadv = upem
+            glyph_bounds = bounds[name]
+            if glyph_bounds is None:
+                metrics[name] = (vadv, vorg)
+            else:
+                metrics[name] = (vadv, vorg - math.ceil(glyph_bounds[3]))
+
+        vmtx = font["vmtx"] = newTable("vmtx")
+        vmtx.metrics = metrics
+        vorg_table = font["VORG"] = newTable("VORG")
+        vorg_table.majorVersion = 1
+        vorg_table.minorVersion = 0
+        vorg_table.defaultVertOriginY = default_vorg
+        vorg_table.VOriginRecords = vorigins
+        vorg_table.numVertOriginYMetrics = len(vorigins)
+
     def generate(self):
         lines = []
         lines.append("table vmtx {")
@@ -57,9 +120,11 @@ def parse_map(mappath):
 def mkvmtxfeat(infiles):
     gen = VMTXFeatureGenerator()
     for mapfile, fontfile in infiles:
-        cidmap = parse_map(mapfile)
-        gen.import_font(TTFont(fontfile), cidmap)
-    return gen.generate()
+        with stage("parse_map"):
+            cidmap = parse_map(mapfile)
+        gen.import_file(fontfile, cidmap)
+    with stage("generate"):
+        return gen.generate()
 
 
 def main():
@@ -67,7 +132,9 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--outfile", "-o")
     parser.add_argument("files", nargs="+")
+    add_profile_argument(parser)
     args = parser.parse_args()
+    setup_profile(args.profile)
 
     if len(args.files) % 2 != 0:
         raise ValueError("number of files must be even")
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from fontTools.pens.svgPathPen import SVGPathPen
+from fontTools.svgLib import parse_path
+import pathops
+
+import config  # noqa, pylint: disable=unused-import
+from xmlns import NSMAP
+from xmlns import SVG_NS
+
+
+# Stroke style of the primitives; keep in sync with edit.css.
+# Expanded SVGs have no transforms, so the non-scaling stroke is simply
+# applied in the user space of the root element.
+STROKE_WIDTH = 9
+STROKE_CAP = pathops.LineCap.ROUND_CAP
+STROKE_JOIN = pathops.LineJoin.ROUND_JOIN
+STROKE_MITER_LIMIT = 4
+
+
+def rect_to_path(x, y, width, height):
+    path = pathops.Path()
+    path.moveTo(x, y)
+    path.lineTo(x + width, y)
+    path.lineTo(x + width, y + height)
+    path.lineTo(x, y + height)
+    path.close()
+    return path
+
+
+def get_rect(elem):
+    return [float(elem.get(attr)) for attr in ("x", "y", "width", "height")]
+
+
+def get_primitive_path(elem):
+    if elem.tag == SVG_NS + "rect":
+        return rect_to_path(*get_rect(elem))
+    path = pathops.Path()
+    if elem.tag == SVG_NS + "path":
+        parse_path(elem.get("d"), path.getPen(allow_open_paths=True))
+    else:
+        raise ValueError("unsupported element: {0}".format(elem.tag))
+    return path
+
+
+def stroke_to_path(elems, name=None):
+    paths = []
+    for elem in elems:
+        path = get_primitive_path(elem)
+        path.stroke(STROKE_WIDTH, STROKE_CAP, STROKE_JOIN, STROKE_MITER_LIMIT)
+        path.convertConicsToQuads()
+        paths.append(path)
+    result = pathops.Path()
+    for path in paths:
+        result.addPath(path)
+    # Resolving the overlaps with the nonzero rule unites all the outlines.
+    # Clockwise in the y-down SVG space is counter-clockwise in the font.
+    try:
+        result.simplify(fix_winding=True, keep_starting_points=False,
+                        clockwise=True)
+    except pathops.PathOpsError as exc:
+        print("warning: {0}: {1}; uniting the strokes one by one".format(
+            name, exc), file=sys.stderr)
+        result = unite_paths(paths, name)
+    return result
+
+
+def unite_paths(paths, name=None):
+    # Slower but more robust than simplifying all the strokes at once; a
+    # stroke that still cannot be united is added as it is, which fills the
+    # same area with the nonzero rule but leaves overlaps in the outline
+    result = pathops.Path()
+    for i, path in enumerate(paths):
+        try:
+            path.simplify(fix_winding=True, keep_starting_points=False,
+                          clockwise=True)
+            result = pathops.op(
+                result, path, pathops.PathOp.UNION,
+                keep_starting_points=False, clockwise=True)
+        except pathops.PathOpsError as exc:
+            print("warning: {0}: stroke {1}: {2}; left overlapping".format(
+                name, i, exc), file=sys.stderr)
+            result.addPath(path)
+    return result
+
+
+def invert_path(path, rect):
+    return pathops.op(
+        rect_to_path(*rect), path, pathops.PathOp.DIFFERENCE,
+        keep_starting_points=False, clockwise=True)
+
+
+def path_to_d(path):
+    pen = SVGPathPen(None)
+    path.draw(pen)
+    return pen.getCommands()
+
+
+def get_primitives(svg):
+    glyph = svg.find(".//svg:g[@id='glyph']", NSMAP)
+    return glyph, [
+        elem for elem in glyph
+        if elem.tag in {SVG_NS + "rect", SVG_NS + "path"}
+        and elem.get("id") != "bbx_rect"
+    ]
+
+
+def get_bbx_rect(glyph):
+    return get_rect(glyph.find("svg:rect[@id='bbx_rect']", NSMAP))
+
+
+def replace_elems(glyph, elems, path):
+    for elem in elems:
+        glyph.remove(elem)
+    glyph.append(ET.Element(SVG_NS + "path", {
+        "d": path if isinstance(path, str) else path_to_d(path),
+    }))
+
+
+def set_outline(svg, path, invert=False):
+    glyph, elems = get_primitives(svg)
+    if invert:
+        elems.append(glyph.find("svg:rect[@id='bbx_rect']", NSMAP))
+    replace_elems(glyph, elems, path)
+
+
+def union_tree(svg):
+    glyph, elems = get_primitives(svg)
+    path = stroke_to_path(elems, svg.get("id"))
+    replace_elems(glyph, elems, path)
+    return path
+
+
+def invert_tree(svg, path=None):
+    # The glyph layer of a united SVG holds bbx_rect and the united outline
+    glyph, elems = get_primitives(svg)
+    if path is None:
+        path = pathops.Path()
+        for elem in elems:
+            parse_path(elem.get("d"), path.getPen())
+    path = invert_path(path, get_bbx_rect(glyph))
+    bbx_rect = glyph.find("svg:rect[@id='bbx_rect']", NSMAP)
+    replace_elems(glyph, elems + [bbx_rect], path)
+    return path
+
+
+# Entries that no build used for this many days are dropped from the
+# outline cache when it is saved
+CACHE_MAX_AGE = 30
+
+
+def get_day():
+    return int(time.time() // 86400)
+
+
+# Persistent map from expanded geometry to its outlines. Entries are keyed
+# by a hash of the primitives, the bbx rect and the stroke parameters, and
+# hold the path data of the united and the inverted outline and the day
+# they were last used.
+class OutlineCache(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.today = get_day()
+        self.entries = self.load()
+        self.modified = False
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return {}
+        with open(self.filename) as cachefile:
+            entries = json.load(cachefile)
+        # Entries written before the day was recorded
+        for entry in entries.values():
+            if len(entry) == 2:
+                entry.append(self.today)
+        return entries
+
+    @staticmethod
+    def get_key(elems, rect):
+        primitives = [
+            [elem.tag] + [elem.get(attr)
+                          for attr in ("x", "y", "width", "height", "d")]
+            for elem in elems
+        ]
+        stroke = [STROKE_WIDTH, int(STROKE_CAP), int(STROKE_JOIN),
+                  STROKE_MITER_LIMIT]
+        keydata = json.dumps([stroke, rect, primitives])
+        return hashlib.sha256(keydata.encode("utf-8")).hexdigest()
+
+    def outline(self, elems, rect, name=None):
+        key = self.get_key(elems, rect)
+        entry = self.entries.get(key)
+        if entry is None:
+            path = stroke_to_path(elems, name)
+            entry = [path_to_d(path),
+                     path_to_d(invert_path(path, rect)), self.today]
+            self.entries[key] = entry
+            self.modified = True
+        elif entry[2] != self.today:
+            entry[2] = self.today
+            self.modified = True
+        return entry[0], entry[1]
+
+    def save(self):
+        if not self.modified:
+            return
+        # Other builds may have saved the same file since it was loaded,
+        # e.g. with make -j; their entries are kept
+        entries = self.load()
+        for key, entry in self.entries.items():
+            if key in entries:
+                entry[2] = max(entry[2], entries[key][2])
+            entries[key] = entry
+        oldest = self.today - CACHE_MAX_AGE
+        entries = {key: entry for key, entry in entries.items()
+                   if entry[2] >= oldest}
+        tmpname = "{0}.{1}.tmp".format(self.filename, os.getpid())
+        with open(tmpname, "w") as cachefile:
+            json.dump(entries, cachefile)
+        os.replace(tmpname, self.filename)
+        self.entries = entries
+        self.modified = False
+
+
+def union_svg(svgfile):
+    svg = ET.parse(svgfile).getroot()
+    union_tree(svg)
+    return ET.tostring(svg, encoding="unicode")
+
+
+def invert_svg(svgfile):
+    svg = ET.parse(svgfile).getroot()
+    invert_tree(svg)
+    return ET.tostring(svg, encoding="unicode")
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("infile", nargs="?", type=argparse.FileType("r"),
+                        default=sys.stdin)
+    parser.add_argument("--outfile", "-o", default=None)
+
+    parser.add_argument("--invert", action="store_true",
+                        help="subtract a united glyph from its bbx_rect")
+
+    args = parser.parse_args()
+
+    if args.invert:
+        svg = invert_svg(args.infile)
+    else:
+        svg = union_svg(args.infile)
+    if args.outfile is None:
+        sys.stdout.write(svg)
+    else:
+        with open(args.outfile, "w") as outfile:
+            outfile.write(svg)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import math
+import re
+
+
+_COMMAND_RE = re.compile(r"[\s,]*([MmZzLlHhVvCcSsQqTtAa])")
+_NUMBER_RE = re.compile(
+    r"[\s,]*([-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)")
+_FLAG_RE = re.compile(r"[\s,]*([01])")
+_END_RE = re.compile(r"[\s,]*$")
+
+# Arguments of each command; "n" is a number and "f" is a flag
+_ARG_TYPES = {
+    "M": "nn",
+    "L": "nn",
+    "H": "n",
+    "V": "n",
+    "Q": "nnnn",
+    "T": "nn",
+    "C": "nnnnnn",
+    "S": "nnnn",
+    "A": "nnnffnn",
+}
+
+# Number of points of each command
+POINT_COUNTS = {"M": 1, "L": 1, "Q": 2, "C": 3, "Z": 0}
+
+# Number of cubic Béziers an arc is lowered to. The number only depends on
+# the large-arc flag so that the Béziers of arcs of the same flags in the
+# keys of a glyph can be interpolated.
+ARC_SEGMENTS = {False: 2, True: 4}
+
+
+class PathError(ValueError):
+    pass
+
+
+def arc_to_cubics(x0, y0, rx, ry, rotation, large_arc, sweep, x1, y1):
+    # Control and end points of the cubic Béziers approximating the arc,
+    # following the implementation notes of the SVG specification
+    count = ARC_SEGMENTS[bool(large_arc)]
+    rx = abs(rx)
+    ry = abs(ry)
+    if (x0, y0) == (x1, y1) or rx == 0 or ry == 0:
+        # Degenerate arcs are straight lines (or nothing at all)
+        points = []
+        for i in range(count):
+            for j in (1, 2, 3):
+                t = (3 * i + j) / (3.0 * count)
+                points.append((x0 + (x1 - x0) * t, y0 + (y1 - y0) * t))
+        points[-1] = (x1, y1)
+        return points
+
+    phi = math.radians(rotation % 360)
+    cos_phi = math.cos(phi)
+    sin_phi = math.sin(phi)
+    dx2 = (x0 - x1) / 2.0
+    dy2 = (y0 - y1) / 2.0
+    x1p = cos_phi * dx2 + sin_phi * dy2
+    y1p = -sin_phi * dx2 + cos_phi * dy2
+
+    # Scale up the radii if there is no ellipse through both points
+    lam = (x1p / rx) ** 2 + (y1p / ry) ** 2
+    if lam > 1:
+        rx *= math.sqrt(lam)
+        ry *= math.sqrt(lam)
+
+    num = (rx * ry) ** 2 - (rx * y1p) ** 2 - (ry * x1p) ** 2
+    den = (rx * y1p) ** 2 + (ry * x1p) ** 2
+    coef = math.sqrt(max(0.0, num / den))
+    if bool(large_arc) == bool(sweep):
+        coef = -coef
+    cxp = coef * rx * y1p / ry
+    cyp = -coef * ry * x1p / rx
+    cx = cos_phi * cxp - sin_phi * cyp + (x0 + x1) / 2.0
+    cy = sin_phi * cxp + cos_phi * cyp + (y0 + y1) / 2.0
+
+    theta1 = math.atan2((y1p - cyp) / ry, (x1p - cxp) / rx)
+    theta2 = math.atan2((-y1p - cyp) / ry, (-x1p - cxp) / rx)
+    dtheta = theta2 - theta1
+    if sweep and dtheta < 0:
+        dtheta += 2 * math.pi
+    elif not sweep and dtheta > 0:
+        dtheta -= 2 * math.pi
+
+    def point(angle):
+        cos_a = math.cos(angle)
+        sin_a = math.sin(angle)
+        return (cx + rx * cos_a * cos_phi - ry * sin_a * sin_phi,
+                cy + rx * cos_a * sin_phi + ry * sin_a * cos_phi)
+
+    def tangent(angle):
+        cos_a = math.cos(angle)
+        sin_a = math.sin(angle)
+        return (-rx * sin_a * cos_phi - ry * cos_a * sin_phi,
+                -rx * sin_a * sin_phi + ry * cos_a * cos_phi)
+
+    step = dtheta / count
+    k = 4.0 / 3.0 * math.tan(step / 4.0)
+    points = []
+    start = (x0, y0)
+    for i in range(count):
+        angle0 = theta1 + step * i
+        angle1 = angle0 + step
+        tan0 = tangent(angle0)
+        tan1 = tangent(angle1)
+        end = (x1, y1) if i == count - 1 else point(angle1)
+        points.append((start[0] + k * tan0[0], start[1] + k * tan0[1]))
+        points.append((end[0] - k * tan1[0], end[1] - k * tan1[1]))
+        points.append(end)
+        start = end
+    return points
+
+
+class _PathBuilder(object):
+    def __init__(self):
+        self.ops = []
+        self.coords = []
+        self.arcs = []
+        self.x = self.y = 0.0
+        self.start_x = self.start_y = 0.0
+        # Control point to be reflected by S and T
+        self.last_control = None
+
+    def add(self, op, *points):
+        self.ops.append(op)
+        for x, y in points:
+            self.coords.append(x)
+            self.coords.append(y)
+        if points:
+            self.x, self.y = points[-1]
+
+    def move(self, x, y):
+        self.add("M", (x, y))
+        self.start_x, self.start_y = x, y
+        self.last_control = None
+
+    def line(self, x, y):
+        self.add("L", (x, y))
+        self.last_control = None
+
+    def quad(self, x1, y1, x, y):
+        self.add("Q", (x1, y1), (x, y))
+        self.last_control = ("Q", x1, y1)
+
+    def cubic(self, x1, y1, x2, y2, x, y):
+        self.add("C", (x1, y1), (x2, y2), (x, y))
+        self.last_control = ("C", x2, y2)
+
+    def reflected(self, op):
+        if self.last_control is None or self.last_control[0] != op:
+            return self.x, self.y
+        return (2 * self.x - self.last_control[1],
+                2 * self.y - self.last_control[2])
+
+    def arc(self, rx, ry, rotation, large_arc, sweep, x, y):
+        self.arcs.append((len(self.ops), rotation % 360, bool(large_arc),
+                          bool(sweep)))
+        points = arc_to_cubics(self.x, self.y, rx, ry, rotation,
+                               large_arc, sweep, x, y)
+        for i in range(0, len(points), 3):
+            self.add("C", *points[i:i + 3])
+        self.last_control = None
+
+    def close(self):
+        self.add("Z")
+        self.x, self.y = self.start_x, self.start_y
+        self.last_control = None
+
+
+class PathData(object):
+    # A path as flat arrays: `ops` has one of "M", "L", "Q", "C" and "Z" per
+    # command and `coords` has the absolute x and y of all their points in
+    # order, so that affine maps and interpolation only touch `coords`.
+    # Relative and shorthand commands are resolved and arcs are lowered to
+    # cubic Béziers when parsed. `arcs` keeps, for each arc, the index of
+    # its first Bézier in `ops`, its rotation and its large-arc and sweep
+    # flags so that keys can still be checked for compatibility. Do not
+    # modify the arrays.
+    __slots__ = ("ops", "coords", "arcs")
+
+    def __init__(self, ops, coords, arcs=()):
+        self.ops = ops
+        self.coords = coords
+        self.arcs = arcs
+
+    @staticmethod
+    def parse(d):
+        builder = _PathBuilder()
+        pos = 0
+        command = None
+        while not _END_RE.match(d, pos):
+            match = _COMMAND_RE.match(d, pos)
+            if match is not None:
+                command = match.group(1)
+                pos = match.end()
+            elif command is None or command in "Zz":
+                raise PathError("invalid path data: {0!r}".format(d))
+
+            upper = command.upper()
+            if upper == "Z":
+                builder.close()
+                continue
+
+            relative = command != upper
+            args = []
+            for argtype in _ARG_TYPES[upper]:
+                match = (_FLAG_RE if argtype == "f" else _NUMBER_RE).match(
+                    d, pos)
+                if match is None:
+                    raise PathError("invalid path data: {0!r}".format(d))
+                args.append(float(match.group(1)))
+                pos = match.end()
+
+            if relative:
+                if upper in "HV":
+                    args[0] += builder.x if upper == "H" else builder.y
+                elif upper == "A":
+                    args[5] += builder.x
+                    args[6] += builder.y
+                else:
+                    for i in range(0, len(args), 2):
+                        args[i] += builder.x
+                        args[i + 1] += builder.y
+
+            if upper == "M":
+                builder.move(*args)
+                # Further coordinate pairs are implicit lineto commands
+                command = "l" if relative else "L"
+            elif upper == "L":
+                builder.line(*args)
+            elif upper == "H":
+                builder.line(args[0], builder.y)
+            elif upper == "V":
+                builder.line(builder.x, args[0])
+            elif upper == "Q":
+                builder.quad(*args)
+            elif upper == "T":
+                builder.quad(*(builder.reflected("Q") + tuple(args)))
+            elif upper == "C":
+                builder.cubic(*args)
+            elif upper == "S":
+                builder.cubic(*(builder.reflected("C") + tuple(args)))
+            else:
+                builder.arc(*args)
+        return PathData("".join(builder.ops), builder.coords,
+                        tuple(builder.arcs))
+
+    def resized(self, xscale, yscale, dx=0.0, dy=0.0):
+        coords = self.coords
+        resized = [0.0] * len(coords)
+        resized[0::2] = [x * xscale + dx for x in coords[0::2]]
+        resized[1::2] = [y * yscale + dy for y in coords[1::2]]
+        return PathData(self.ops, resized, self.arcs)
+
+    def transformed(self, xx, xy, yx, yy, dx, dy):
+        # Maps (x, y) to (xx * x + yx * y + dx, xy * x + yy * y + dy), with
+        # the components in the order of fontTools.misc.transform.Transform
+        coords = self.coords
+        xs = coords[0::2]
+        ys = coords[1::2]
+        transformed = [0.0] * len(coords)
+        transformed[0::2] = [xx * x + yx * y + dx for x, y in zip(xs, ys)]
+        transformed[1::2] = [xy * x + yy * y + dy for x, y in zip(xs, ys)]
+        return PathData(self.ops, transformed, self.arcs)
+
+    def d(self):
+        parts = []
+        coords = self.coords
+        offset = 0
+        for op in self.ops:
+            count = 2 * POINT_COUNTS[op]
+            parts.append(op if count == 0 else op + " " + " ".join(
+                "{0},{1}".format(coords[i], coords[i + 1])
+                for i in range(offset, offset + count, 2)))
+            offset += count
+        return " ".join(parts)
+
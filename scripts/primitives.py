@@ -0,0 +1,102 @@
+from pathdata import PathData
+from util import parse_numeric
+
+
+class Use(object):
+    __slots__ = ("x", "y", "width", "height", "name")
+
+    def __init__(self, x, y, width, height, name):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.name = name
+
+    def __str__(self):
+        return "use {0} {1} {2} {3} {4}".format(
+            self.x, self.y, self.width, self.height, self.name)
+
+
+class Rect(object):
+    __slots__ = ("x", "y", "width", "height")
+
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    def __str__(self):
+        return "rect {0} {1} {2} {3}".format(
+            self.x, self.y, self.width, self.height)
+
+
+class Path(object):
+    # Either of the path data and the parsed path may be omitted; the other
+    # is made from it when first needed
+    __slots__ = ("_d", "_parsed")
+
+    def __init__(self, d=None, parsed=None):
+        self._d = d
+        self._parsed = parsed
+
+    def __reduce__(self):
+        # Do not pickle the parsed path
+        return (Path, (self.d,))
+
+    @property
+    def d(self):
+        if self._d is None:
+            self._d = self._parsed.d()
+        return self._d
+
+    def parsed(self):
+        # PathData, parsed on first use; do not modify it
+        if self._parsed is None:
+            self._parsed = PathData.parse(self._d)
+        return self._parsed
+
+    def __str__(self):
+        return "path {0}".format(self.d)
+
+
+PRIMITIVE_TYPES = (Use, Rect, Path)
+
+
+def compile_line(line):
+    if isinstance(line, PRIMITIVE_TYPES):
+        return line
+    tokens = line.split()
+    assert tokens[0] in {"use", "rect", "path"}
+    if tokens[0] == "use":
+        x, y, width, height = [parse_numeric(x) for x in tokens[1:5]]
+        return Use(x, y, width, height, tokens[5])
+    if tokens[0] == "rect":
+        x, y, width, height = [parse_numeric(x) for x in tokens[1:]]
+        return Rect(x, y, width, height)
+    return Path(" ".join(tokens[1:]))
+
+
+def compile_lines(lines):
+    return [compile_line(line) for line in lines]
+
+
+class GlyphRecord(dict):
+    # Glyph record whose data lines (including those of the keys) are
+    # compiled into primitives
+    __slots__ = ()
+
+
+def compile_glyph(data):
+    # Returns a compiled copy of the glyph record, or the record itself if
+    # it is already compiled
+    if isinstance(data, GlyphRecord):
+        return data
+    compiled = GlyphRecord(data)
+    compiled["data"] = compile_lines(data["data"])
+    if "keys" in data:
+        compiled["keys"] = [
+            dict(key, data=compile_lines(key["data"]))
+            for key in data["keys"]
+        ]
+    return compiled
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+import atexit
+import glob
+import json
+import os.path
+import resource
+import sys
+import time
+
+
+# Directory to which every script writes its report when profiling is not
+# requested by --profile, e.g. `KAPPOTAI_PROFILE=build/profile make`
+PROFILE_ENV = "KAPPOTAI_PROFILE"
+
+
+def get_peak_rss():
+    # Peak resident set size of this process in KiB (on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def get_rss():
+    # Current resident set size of this process in KiB (on Linux)
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * (resource.getpagesize() // 1024)
+
+
+class _Stage(object):
+    __slots__ = ("profiler", "name", "glyph", "outer", "start",
+                 "start_rss", "start_peak")
+
+    def __init__(self, profiler, name, glyph):
+        self.profiler = profiler
+        self.name = name
+        self.glyph = glyph
+        self.outer = None
+        self.start = None
+        self.start_rss = None
+        self.start_peak = None
+
+    def __enter__(self):
+        profiler = self.profiler
+        self.outer = profiler.current
+        if self.glyph is None:
+            # Nested stages are accounted to the glyph being processed
+            self.glyph = self.outer
+        else:
+            profiler.current = self.glyph
+        self.start_rss = get_rss()
+        self.start_peak = get_peak_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        # The peak of the stage is only known if it raised that of the
+        # process; otherwise the larger of the RSS at entry and at exit is
+        # taken, which misses memory freed before the stage ended
+        peak = get_peak_rss()
+        if peak <= self.start_peak:
+            peak = max(self.start_rss, get_rss())
+        profiler = self.profiler
+        profiler.current = self.outer
+        profiler.add(self.name, self.glyph, elapsed,
+                     toplevel=self.glyph != self.outer,
+                     rss_growth=peak - self.start_rss)
+        return False
+
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler(object):
+    # Wall time, number of calls and the largest growth of the RSS during
+    # a call of each stage, and the time and calls per glyph. Stages may
+    # nest and the time of a stage includes the time of the stages inside
+    # it; the total of a glyph is the time spent in the outermost stages
+    # entered for it. The peak RSS of the whole process is reported apart.
+
+    def __init__(self, script=None):
+        self.script = script
+        self.start = time.perf_counter()
+        self.current = None
+        # name -> {"calls", "time", "rss_growth_kb"}
+        self.stages = {}
+        # glyph -> {"total", "stages": {name -> {"calls", "time"}}}
+        self.glyphs = {}
+        self.workers = 0
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.current = None
+        self.stages = {}
+        self.glyphs = {}
+        self.workers = 0
+
+    def stage(self, name, glyph=None):
+        return _Stage(self, name, glyph)
+
+    def add(self, name, glyph, elapsed, toplevel=False, rss_growth=0):
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = {
+                "calls": 0, "time": 0.0, "rss_growth_kb": 0}
+        record["calls"] += 1
+        record["time"] += elapsed
+        record["rss_growth_kb"] = max(record["rss_growth_kb"], rss_growth)
+        if glyph is None:
+            return
+        grecord = self.glyphs.get(glyph)
+        if grecord is None:
+            grecord = self.glyphs[glyph] = {"total": 0.0, "stages": {}}
+        if toplevel:
+            grecord["total"] += elapsed
+        gstage = grecord["stages"].get(name)
+        if gstage is None:
+            gstage = grecord["stages"][name] = {"calls": 0, "time": 0.0}
+        gstage["calls"] += 1
+        gstage["time"] += elapsed
+
+    def report(self):
+        return {
+            "script": self.script,
+            "argv": sys.argv,
+            "pid": os.getpid(),
+            "wall_time": time.perf_counter() - self.start,
+            "peak_rss_kb": get_peak_rss(),
+            "workers": self.workers,
+            "stages": self.stages,
+            "glyphs": self.glyphs,
+        }
+
+    def merge(self, report):
+        # Adds the records of another report, e.g. of a worker process
+        for name, record in report["stages"].items():
+            mine = self.stages.setdefault(
+                name, {"calls": 0, "time": 0.0, "rss_growth_kb": 0})
+            mine["calls"] += record["calls"]
+            mine["time"] += record["time"]
+            mine["rss_growth_kb"] = max(mine["rss_growth_kb"],
+                                        record["rss_growth_kb"])
+        for glyph, grecord in report["glyphs"].items():
+            mine = self.glyphs.setdefault(glyph, {"total": 0.0, "stages": {}})
+            mine["total"] += grecord["total"]
+            for name, record in grecord["stages"].items():
+                gstage = mine["stages"].setdefault(
+                    name, {"calls": 0, "time": 0.0})
+                gstage["calls"] += record["calls"]
+                gstage["time"] += record["time"]
+
+
+def format_summary(report, limit=20):
+    lines = []
+    lines.append("{0:<24} {1:>8} {2:>10} {3:>16}".format(
+        "stage", "calls", "time (s)", "RSS growth (MiB)"))
+    for name, record in sorted(report["stages"].items(),
+                               key=lambda item: -item[1]["time"]):
+        lines.append("{0:<24} {1:>8} {2:>10.3f} {3:>16.1f}".format(
+            name, record["calls"], record["time"],
+            record["rss_growth_kb"] / 1024.0))
+    lines.append("")
+    lines.append("{0:<24} {1:>10}  {2}".format(
+        "slowest glyphs", "time (s)", "slowest stages"))
+    glyphs = sorted(report["glyphs"].items(),
+                    key=lambda item: -item[1]["total"])
+    for glyph, grecord in glyphs[:limit]:
+        stages = sorted(grecord["stages"].items(),
+                        key=lambda item: -item[1]["time"])
+        lines.append("{0:<24} {1:>10.3f}  {2}".format(
+            glyph, grecord["total"], ", ".join(
+                "{0} {1:.3f}".format(name, record["time"])
+                for name, record in stages[:3])))
+    lines.append("")
+    lines.append("wall time {0:.3f} s, peak RSS {1:.1f} MiB".format(
+        report["wall_time"], report["peak_rss_kb"] / 1024.0))
+    return "\n".join(lines) + "\n"
+
+
+def write_report(report, reportfile):
+    with open(reportfile, "w") as outfile:
+        json.dump(report, outfile, indent=1, sort_keys=True)
+        outfile.write("\n")
+
+
+_profiler = None
+
+
+def get_profiler():
+    return _profiler
+
+
+def stage(name, glyph=None):
+    # Context manager timing a stage; does nothing unless profiling
+    if _profiler is None:
+        return _NULL_STAGE
+    return _profiler.stage(name, glyph)
+
+
+def add_profile_argument(parser):
+    parser.add_argument("--profile", metavar="FILE", default=None,
+                        help="write the time, number of calls and memory "
+                        "growth of each stage and glyph to FILE and print "
+                        "the slowest ones (default: ${0}/SCRIPT-PID.json "
+                        "if set)".format(PROFILE_ENV))
+
+
+def setup_profile(reportfile=None, script=None):
+    # Enables profiling if a report file is given or PROFILE_ENV is set;
+    # the report is written when the script exits
+    global _profiler  # pylint: disable=global-statement
+    if script is None:
+        script = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    show_summary = True
+    if reportfile is None:
+        profiledir = os.environ.get(PROFILE_ENV)
+        if not profiledir:
+            return None
+        os.makedirs(profiledir, exist_ok=True)
+        reportfile = os.path.join(
+            profiledir, "{0}-{1}.json".format(script, os.getpid()))
+        # Reports of a whole build are summarized by this script instead
+        show_summary = False
+    _profiler = Profiler(script)
+
+    def finish():
+        report = _profiler.report()
+        write_report(report, reportfile)
+        if show_summary:
+            sys.stderr.write(format_summary(report))
+
+    atexit.register(finish)
+    return _profiler
+
+
+def call_worker(func, *args):
+    # Runs func in a worker process and returns its result together with
+    # the records made meanwhile, which are passed to merge_worker by the
+    # parent. Worker processes exit without running atexit handlers.
+    if _profiler is None:
+        return func(*args), None
+    # Forked workers inherit the records made by the parent so far
+    _profiler.reset()
+    result = func(*args)
+    return result, _profiler.report()
+
+
+def merge_worker(result):
+    result, report = result
+    if report is not None and _profiler is not None:
+        _profiler.merge(report)
+        _profiler.workers += 1
+    return result
+
+
+def load_reports(paths):
+    reports = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(glob.glob(os.path.join(path, "*.json")))
+        else:
+            files = [path]
+        for file in files:
+            with open(file) as infile:
+                reports.append(json.load(infile))
+    return reports
+
+
+def merge_reports(reports):
+    profiler = Profiler(script=None)
+    wall_time = 0.0
+    peak_rss = 0
+    for report in reports:
+        profiler.merge(report)
+        wall_time += report["wall_time"]
+        peak_rss = max(peak_rss, report["peak_rss_kb"])
+    merged = profiler.report()
+    merged["script"] = sorted({report["script"] for report in reports})
+    merged["wall_time"] = wall_time
+    # The largest peak of a single process; those of processes running
+    # at the same time are not added up
+    merged["peak_rss_kb"] = peak_rss
+    merged["workers"] = sum(report["workers"] for report in reports)
+    merged["reports"] = len(reports)
+    return merged
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="summarize profile reports written by the scripts")
+    parser.add_argument("report", nargs="+",
+                        help="report file or directory of report files")
+    parser.add_argument("--outfile", "-o", default=None,
+                        help="write the merged report to this file")
+    parser.add_argument("--limit", "-n", type=int, default=20,
+                        help="number of glyphs to list")
+
+    args = parser.parse_args()
+
+    reports = load_reports(args.report)
+    if not reports:
+        parser.error("no reports found")
+    merged = merge_reports(reports)
+    if args.outfile is not None:
+        write_report(merged, args.outfile)
+    sys.stdout.write(format_summary(merged, limit=args.limit))
+
+
+if __name__ == "__main__":
+    main()
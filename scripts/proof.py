@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import os.path
+import sys
+
+from fontTools.pens.recordingPen import RecordingPen
+from fontTools.pens.transformPen import TransformPen
+from fontTools.svgLib import parse_path
+from fontTools.ttLib import TTFont
+
+import config  # noqa, pylint: disable=unused-import
+from mkotf import collect_outlines
+from mkotf import Outline
+from outline import OutlineCache
+from profiling import add_profile_argument
+from profiling import call_worker
+from profiling import merge_worker
+from profiling import setup_profile
+from profiling import stage
+from raster import compose_sheet
+from raster import rasterize
+from raster import RasterPen
+from raster import to_gray
+from raster import write_png
+from writesvg import schedule_files
+
+
+# Space around the glyph box in a thumbnail relative to the box size, so
+# that strokes on the edges of the box are not cut off
+MARGIN = 0.05
+
+
+def render_outline(outline, size, frame=None):
+    # Thumbnail of size x size pixels with the glyph box, or the box of
+    # (width, height) given as frame, centered
+    width, height = frame or (outline.advwidth, outline.advheight)
+    scale = size / (max(width, height) * (1 + 2 * MARGIN))
+    dx = (size - width * scale) / 2.0
+    dy = (size - height * scale) / 2.0
+    with stage("rasterize", outline.name):
+        pen = RasterPen()
+        tpen = TransformPen(pen, (scale, 0, 0, scale, dx, dy))
+        if isinstance(outline.d, str):
+            parse_path(outline.d, tpen)
+        else:
+            # Already parsed outline, e.g. pathops.Path
+            outline.d.draw(tpen)
+        return to_gray(rasterize(pen.contours, size, size))
+
+
+def render_files(files, size, invert=False, cache=None):
+    images = []
+    for outline in collect_outlines(files, cache=cache):
+        if invert:
+            outline = outline.inverted()
+        images.append((outline.name, render_outline(outline, size)))
+    return images
+
+
+def get_font_outlines(fontfile, names=None):
+    # Outlines of the glyphs of a font in the coordinates of the SVGs, i.e.
+    # y down from the ascender
+    font = TTFont(fontfile)
+    glyphset = font.getGlyphSet()
+    hhea = font["hhea"]
+    ascent = hhea.ascent
+    advheight = hhea.ascent - hhea.descent
+    if names is None:
+        names = font.getGlyphOrder()
+    outlines = []
+    for name in names:
+        recording = RecordingPen()
+        glyphset[name].draw(
+            TransformPen(recording, (1, 0, 0, -1, 0, ascent)))
+        outlines.append(Outline(name, recording,
+                                font["hmtx"][name][0], advheight))
+    return outlines
+
+
+def render_font_glyphs(fontfile, names, size):
+    with stage("load_font"):
+        outlines = get_font_outlines(fontfile, names)
+    return [(outline.name, render_outline(outline, size))
+            for outline in outlines]
+
+
+def get_files(srcs):
+    files = []
+    for src in srcs:
+        if os.path.isdir(src):
+            files.extend(sorted(glob.glob(os.path.join(src, "*.svg")) +
+                                glob.glob(os.path.join(src, "*.yaml"))))
+        else:
+            files.append(src)
+    return files
+
+
+def render_proofs(srcs, size, fontfile=None, invert=False, cachefile=None,
+                  jobs=1):
+    # Returns the thumbnails as pairs of the glyph name and the image in
+    # the order of the glyphs in the font or of the source files
+    if fontfile is not None:
+        items = TTFont(fontfile).getGlyphOrder()
+        if jobs <= 1 or len(items) <= 1:
+            return render_font_glyphs(fontfile, items, size)
+        # Interleave so that each worker gets glyphs of every kind
+        chunks = [items[i::jobs] for i in range(jobs)]
+        args = [[fontfile] * jobs, chunks, [size] * jobs]
+        func = render_font_glyphs
+    else:
+        items = get_files(srcs)
+        # Outlines are only read from the cache; new ones are not saved
+        cache = None if cachefile is None else OutlineCache(cachefile)
+        if jobs <= 1 or len(items) <= 1:
+            return render_files(items, size, invert=invert, cache=cache)
+        chunks = schedule_files(items, jobs)
+        args = [chunks, [size] * len(chunks), [invert] * len(chunks),
+                [cache] * len(chunks)]
+        func = render_files
+
+    rendered = {}
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        results = executor.map(call_worker, [func] * len(chunks), *args)
+        for chunk, result in zip(chunks, results):
+            rendered.update(zip(chunk, merge_worker(result)))
+    return [rendered[item] for item in items]
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="render glyphs to PNG thumbnails and a proof sheet "
+        "without Inkscape")
+    parser.add_argument("src", nargs="*",
+                        help="YAML or outlined SVG files or directories of "
+                        "them, e.g. data")
+    parser.add_argument("--font", metavar="FILE", default=None,
+                        help="render the glyphs of this font instead of the "
+                        "sources")
+    parser.add_argument("--outdir", "-d", default=None,
+                        help="write a thumbnail of each glyph to "
+                        "OUTDIR/NAME.png")
+    parser.add_argument("--sheet", "-o", default=None,
+                        help="write a proof sheet of all glyphs to this PNG "
+                        "file and their names in order to SHEET.txt")
+    parser.add_argument("--size", "-s", type=int, default=96,
+                        help="size of a thumbnail in pixels")
+    parser.add_argument("--columns", "-c", type=int, default=16,
+                        help="number of thumbnails in a row of the sheet")
+    parser.add_argument("--jobs", "-j", type=int, default=1)
+    parser.add_argument("--invert", action="store_true",
+                        help="subtract glyphs read from YAML from their "
+                        "bbx_rect")
+    parser.add_argument("--cache", metavar="FILE", default=None,
+                        help="reuse outlines of unchanged geometry stored "
+                        "in FILE")
+    add_profile_argument(parser)
+
+    args = parser.parse_args()
+    setup_profile(args.profile)
+
+    if (args.font is None) == (not args.src):
+        parser.error("give either sources or --font")
+    if args.outdir is None and args.sheet is None:
+        parser.error("at least one of --outdir and --sheet is required")
+
+    images = render_proofs(args.src, args.size, fontfile=args.font,
+                           invert=args.invert, cachefile=args.cache,
+                           jobs=args.jobs)
+    if not images:
+        print("no glyphs to render", file=sys.stderr)
+        return
+    with stage("write"):
+        if args.outdir is not None:
+            os.makedirs(args.outdir, exist_ok=True)
+            for name, image in images:
+                write_png(os.path.join(
+                    args.outdir, "{0}.png".format(name)), image)
+        if args.sheet is not None:
+            write_png(args.sheet, compose_sheet(
+                [image for _, image in images], args.columns))
+            with open(args.sheet + ".txt", "w") as legend:
+                for name, _ in images:
+                    legend.write("{0}\n".format(name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import math
+import struct
+import zlib
+
+from fontTools.pens.basePen import BasePen
+import numpy as np
+
+
+# Number of scanlines sampled per pixel row; coverage along a scanline is
+# computed exactly, so this only affects the vertical anti-aliasing
+SUBSAMPLES = 16
+
+# Maximum distance in pixels between a curve and its flattened polygon
+TOLERANCE = 0.1
+
+
+class RasterPen(BasePen):
+    # Collects the contours drawn into it as closed polygons in pixel
+    # coordinates (y down), flattening the curves
+
+    def __init__(self, glyphset=None, tolerance=TOLERANCE):
+        super().__init__(glyphset)
+        self.tolerance = tolerance
+        self.contours = []
+        self.points = None
+
+    def _moveTo(self, pt):
+        self._flush()
+        self.points = [pt]
+
+    def _lineTo(self, pt):
+        self.points.append(pt)
+
+    def _curveToOne(self, pt1, pt2, pt3):
+        pt0 = self._getCurrentPoint()
+        p = np.array([pt0, pt1, pt2, pt3], dtype=float)
+        # Bound of the distance between the curve and its chords
+        dd = max(np.hypot(*(p[0] - 2 * p[1] + p[2])),
+                 np.hypot(*(p[1] - 2 * p[2] + p[3])))
+        t = self._get_params(0.75 * dd)
+        mt = 1 - t
+        points = ((mt ** 3) * p[0] + (3 * mt * mt * t) * p[1] +
+                  (3 * mt * t * t) * p[2] + (t ** 3) * p[3])
+        self.points.extend(map(tuple, points[:-1]))
+        self.points.append(pt3)
+
+    def _qCurveToOne(self, pt1, pt2):
+        pt0 = self._getCurrentPoint()
+        p = np.array([pt0, pt1, pt2], dtype=float)
+        dd = np.hypot(*(p[0] - 2 * p[1] + p[2]))
+        t = self._get_params(0.25 * dd)
+        mt = 1 - t
+        points = (mt * mt) * p[0] + (2 * mt * t) * p[1] + (t * t) * p[2]
+        self.points.extend(map(tuple, points[:-1]))
+        self.points.append(pt2)
+
+    def _get_params(self, error):
+        # Parameters of the polygon points such that the flattening error,
+        # which is error / n ** 2 for n segments, is within the tolerance
+        count = min(64, max(1, int(math.ceil(
+            math.sqrt(error / self.tolerance)))))
+        return (np.arange(1, count + 1, dtype=float) / count)[:, None]
+
+    def _closePath(self):
+        self._flush()
+
+    def _endPath(self):
+        # Open contours are filled as if they were closed
+        self._flush()
+
+    def _flush(self):
+        if self.points is not None and len(self.points) > 2:
+            self.contours.append(np.array(self.points, dtype=float))
+        self.points = None
+
+
+def get_edges(contours):
+    # Edges of the closed polygons as arrays of x0, y0, x1, y1
+    if not contours:
+        return (np.zeros(0),) * 4
+    starts = np.concatenate(contours)
+    ends = np.concatenate([np.roll(points, -1, axis=0)
+                           for points in contours])
+    return starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+
+
+def rasterize(contours, width, height, subsamples=SUBSAMPLES):
+    # Coverage of the polygons filled with the non-zero winding rule as a
+    # float array of shape (height, width) in [0, 1]. Each polygon edge is
+    # intersected with the scanlines at the same time: the crossings are
+    # sorted along their scanline, the running sum of their directions is
+    # the winding number of the span up to the next crossing, and spans with
+    # a non-zero winding number are accumulated with their exact horizontal
+    # coverage of the pixels.
+    x0, y0, x1, y1 = get_edges(contours)
+    rows = height * subsamples
+    # Scanline r is at y = (r + 0.5) / subsamples
+    y0 = y0 * subsamples - 0.5
+    y1 = y1 * subsamples - 0.5
+    keep = y0 != y1
+    x0, y0, x1, y1 = x0[keep], y0[keep], x1[keep], y1[keep]
+    direction = np.where(y1 > y0, 1, -1)
+    # An edge crosses scanline r if min(y0, y1) <= r < max(y0, y1); edges
+    # are clipped by whole scanlines, which keeps the crossings of every
+    # scanline balanced
+    first = np.clip(np.ceil(np.minimum(y0, y1)), 0, rows).astype(np.intp)
+    last = np.clip(np.ceil(np.maximum(y0, y1)), 0, rows).astype(np.intp)
+    counts = last - first
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros((height, width))
+
+    edge = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    row = first[edge] + (np.arange(total) - np.repeat(offsets, counts))
+    x = x0[edge] + (row - y0[edge]) * (
+        (x1 - x0) / (y1 - y0))[edge]
+    order = np.lexsort((x, row))
+    row = row[order]
+    x = np.clip(x[order], 0, width)
+    winding = np.cumsum(direction[edge][order])
+
+    # Crossings are balanced per scanline, so the span after a crossing
+    # with a non-zero winding number ends at the next crossing of the same
+    # scanline
+    inside = np.flatnonzero(winding[:-1] != 0)
+    row = row[inside]
+    xa = x[inside]
+    xb = x[inside + 1]
+    # The coverage of pixel p by the span [xa, xb) is H(xb)[p] - H(xa)[p]
+    # with H(t)[p] = clip(t - p, 0, 1): ones up to pixel floor(t) and the
+    # fraction of t at it. The runs of ones are accumulated as differences
+    # and the fractions directly.
+    ia = np.floor(xa).astype(np.intp)
+    ib = np.floor(xb).astype(np.intp)
+    stride = width + 1
+    base = row * stride
+    size = rows * stride
+    steps = np.bincount(np.concatenate((base + ia, base + ib)),
+                        weights=np.concatenate((np.ones(len(ia)),
+                                                -np.ones(len(ib)))),
+                        minlength=size)
+    fractions = np.bincount(np.concatenate((base + ib, base + ia)),
+                            weights=np.concatenate((xb - ib, ia - xa)),
+                            minlength=size)
+    coverage = (np.cumsum(steps.reshape(rows, stride), axis=1) +
+                fractions.reshape(rows, stride))[:, :width]
+    coverage = coverage.reshape(height, subsamples, width).mean(axis=1)
+    return np.clip(coverage, 0.0, 1.0)
+
+
+def to_gray(coverage):
+    # Black ink on white paper as 8-bit grayscale
+    return np.round(255.0 * (1.0 - coverage)).astype(np.uint8)
+
+
+def compose_sheet(images, columns, gap=4, background=255):
+    # Lays out grayscale images of the same size in a grid
+    height, width = images[0].shape
+    rows = (len(images) + columns - 1) // columns
+    columns = min(columns, len(images))
+    sheet = np.full((rows * (height + gap) + gap,
+                     columns * (width + gap) + gap), background, np.uint8)
+    for i, image in enumerate(images):
+        top = gap + (i // columns) * (height + gap)
+        left = gap + (i % columns) * (width + gap)
+        sheet[top:top + height, left:left + width] = image
+    return sheet
+
+
+def _png_chunk(tag, data):
+    return (struct.pack(">I", len(data)) + tag + data +
+            struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+
+
+def encode_png(image):
+    # 8-bit grayscale PNG of a uint8 array of shape (height, width)
+    height, width = image.shape
+    raw = np.zeros((height, width + 1), np.uint8)
+    # Filter type 0 (none) at the start of each row
+    raw[:, 1:] = image
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height,
+                                        8, 0, 0, 0, 0)),
+        _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), 9)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+
+def write_png(path, image):
+    # Returns whether the file is written, leaving unchanged images alone
+    content = encode_png(image)
+    try:
+        with open(path, "rb") as oldfile:
+            if oldfile.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "wb") as outfile:
+        outfile.write(content)
+    return True
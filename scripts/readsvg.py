@@ -1,93 +1,165 @@
 #!/usr/bin/env python3
 
+import os.path
 import sys
 
 from lxml import etree as ET
 import yaml
 
 import config  # noqa, pylint: disable=unused-import
+from profiling import add_profile_argument
+from profiling import setup_profile
+from profiling import stage
 from util import parse_numeric
-from xmlns import NSMAP
+from util import write_if_changed
 from xmlns import SVG_NS
 from xmlns import XLINK_NS
 
 
+USE_TAG = SVG_NS + "use"
+RECT_TAG = SVG_NS + "rect"
+PATH_TAG = SVG_NS + "path"
+G_TAG = SVG_NS + "g"
+DEFS_TAG = SVG_NS + "defs"
+HREF_ATTR = XLINK_NS + "href"
+
+
+def get_line(elem):
+    tag = elem.tag
+    if tag == USE_TAG:
+        name = elem.get(HREF_ATTR)[1:].split("-")[0]
+        return "use {0} {1} {2} {3} {4}".format(
+            elem.get("x"),
+            elem.get("y"),
+            elem.get("width"),
+            elem.get("height"),
+            name
+        )
+    if tag == RECT_TAG:
+        return "rect {0} {1} {2} {3}".format(
+            elem.get("x"),
+            elem.get("y"),
+            elem.get("width"),
+            elem.get("height")
+        )
+    if tag == PATH_TAG:
+        return "path {0}".format(elem.get("d"))
+    return None
+
+
 def get_glyph(elems):
+    return [line for line in map(get_line, elems) if line is not None]
+
+
+def readsvg(svgfile):
+    # Reads the glyph in a single pass, freeing elements once they are read.
+    # The first defs of the root is skipped, the first bbx_rect gives the
+    # rect, and the primitives in key-* groups of the root make the keys.
+    data = None
+    rectstr = None
     glyph = []
-    for elem in elems:
-        if elem.tag == SVG_NS + "use":
-            name = elem.get(XLINK_NS + "href")[1:].split("-")[0]
-            glyph.append("use {0} {1} {2} {3} {4}".format(
-                elem.get("x"),
-                elem.get("y"),
-                elem.get("width"),
-                elem.get("height"),
-                name
-            ))
-        elif elem.tag == SVG_NS + "rect":
-            glyph.append("rect {0} {1} {2} {3}".format(
+    keys = []
+    lines = glyph
+    depth = 0
+    defs_seen = False
+    skip_depth = None
+    for event, elem in ET.iterparse(svgfile, events=("start", "end")):
+        if event == "end":
+            depth -= 1
+            if depth == skip_depth:
+                skip_depth = None
+            elif depth == 1 and lines is not glyph:
+                lines = glyph
+            elem.clear(keep_tail=True)
+            if depth == 1:
+                # Drop the finished children of the root as well
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+            continue
+
+        depth += 1
+        if skip_depth is not None:
+            continue
+        if depth == 1:
+            data = {
+                "name": elem.get("id"),
+                "width": parse_numeric(elem.get("width")),
+                "height": parse_numeric(elem.get("height")),
+            }
+        elif depth == 2 and elem.tag == DEFS_TAG and not defs_seen:
+            defs_seen = True
+            skip_depth = 1
+        elif depth == 2 and elem.tag == G_TAG and \
+                elem.get("id", "").startswith("key-"):
+            _num, keyw, keyh = elem.get("id")[len("key-"):].split("-")
+            lines = []
+            keys.append({
+                "width": parse_numeric(keyw),
+                "height": parse_numeric(keyh),
+                "data": lines,
+            })
+        elif rectstr is None and elem.tag == RECT_TAG and \
+                elem.get("id") == "bbx_rect":
+            rectstr = "{0} {1} {2} {3}".format(
                 elem.get("x"),
                 elem.get("y"),
                 elem.get("width"),
                 elem.get("height")
-            ))
-        elif elem.tag == SVG_NS + "path":
-            glyph.append("path {0}".format(elem.get("d")))
-    return glyph
-
+            )
+        else:
+            line = get_line(elem)
+            if line is not None:
+                lines.append(line)
+
+    data["rect"] = rectstr
+    data["data"] = glyph
+    if keys:
+        data["keys"] = keys
+    return data
 
-def readsvg(svgfile):
-    svg = ET.parse(svgfile).getroot()
 
-    svg.remove(svg.find("svg:defs", NSMAP))
+def get_outname(infile):
+    return os.path.splitext(os.path.basename(infile))[0] + ".yaml"
 
-    bbx_rect = svg.find(".//svg:rect[@id='bbx_rect']", NSMAP)
-    rectstr = "{0} {1} {2} {3}".format(
-        bbx_rect.get("x"),
-        bbx_rect.get("y"),
-        bbx_rect.get("width"),
-        bbx_rect.get("height")
-    )
-    bbx_rect.getparent().remove(bbx_rect)
 
-    keys = []
-    for elem in svg.xpath("./svg:g[starts-with(@id, 'key-')]",
-                          namespaces=NSMAP):
-        _num, keyw, keyh = elem.get("id")[len("key-"):].split("-")
-        keys.append({
-            "width": parse_numeric(keyw),
-            "height": parse_numeric(keyh),
-            "data": get_glyph(elem.xpath(".//svg:use|.//svg:rect|.//svg:path",
-                                         namespaces=NSMAP)),
-        })
-        svg.remove(elem)
-
-    glyph = get_glyph(svg.xpath(".//svg:use|.//svg:rect|.//svg:path",
-                                namespaces=NSMAP))
-
-    data = {
-        "name": svg.get("id"),
-        "width": parse_numeric(svg.get("width")),
-        "height": parse_numeric(svg.get("height")),
-        "rect": rectstr,
-        "data": glyph,
-    }
-    if keys:
-        data["keys"] = keys
-    return data
+def dump_yaml(data):
+    return yaml.dump(data, default_flow_style=False)
 
 
 def main():
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("infile", nargs="?", type=argparse.FileType("r"),
-                        default=sys.stdin)
+    parser.add_argument("infile", nargs="*")
     parser.add_argument("--outfile", "-o", default=None)
+    parser.add_argument("--outdir", "-d", default=None)
+    add_profile_argument(parser)
 
     args = parser.parse_args()
-
-    data = readsvg(args.infile)
-    yamldata = yaml.dump(data, default_flow_style=False)
+    setup_profile(args.profile)
+
+    if args.outdir is not None:
+        if args.outfile is not None:
+            parser.error("--outfile and --outdir are mutually exclusive")
+        for infile in args.infile:
+            name = os.path.splitext(os.path.basename(infile))[0]
+            with stage("convert", name):
+                with stage("readsvg"):
+                    data = readsvg(infile)
+                with stage("dump_yaml"):
+                    yamldata = dump_yaml(data)
+                write_if_changed(
+                    os.path.join(args.outdir, get_outname(infile)), yamldata)
+        return
+
+    if len(args.infile) > 1:
+        parser.error("--outdir is required for multiple input files")
+    with stage("readsvg"):
+        if args.infile:
+            data = readsvg(args.infile[0])
+        else:
+            data = readsvg(sys.stdin.buffer)
+    with stage("dump_yaml"):
+        yamldata = dump_yaml(data)
     if args.outfile is None:
         sys.stdout.write(yamldata)
     else:
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import json
+import math
+import os
+import re
+import sys
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+import xml.etree.ElementTree as ET
+
+import config  # noqa, pylint: disable=unused-import
+from glyphdb import get_glyphdb
+from glyphdb import get_yamlpath
+from keyarray import InterpolateError
+from outline import get_bbx_rect
+from outline import get_primitives
+from outline import invert_path
+from outline import path_to_d
+from outline import set_outline
+from outline import stroke_to_path
+from util import LRUCache
+from writesvg import get_resized_record
+from writesvg import normalize_size
+from writesvg import set_cache_size
+from writesvg import SVGRenderer
+
+
+NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+FORMATS = {
+    # Expanded SVG as written by writesvg.py --expand
+    "svg": "image/svg+xml",
+    # SVG with the united outline as in build/union
+    "outline": "image/svg+xml",
+    # Outline path data and metrics
+    "json": "application/json",
+}
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    422: "Unprocessable Entity",
+    500: "Internal Server Error",
+}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+_renderer = None
+
+
+def init_worker(cache_size):
+    global _renderer  # pylint: disable=global-statement
+    set_cache_size(cache_size)
+    get_glyphdb().set_cache_size(cache_size)
+    _renderer = SVGRenderer(expand=True)
+
+
+def get_variant(name, width, height):
+    # A glyph at another aspect ratio is the glyph used as a component of
+    # that size, normalized so that its longer side is 360 units
+    data = get_glyphdb().get(name)
+    if width is None:
+        width = data["width"]
+    if height is None:
+        height = data["height"]
+    width, height = normalize_size(width, height)
+    return get_resized_record(name, data, width, height)
+
+
+def render_variant(fmt, name, width, height, invert=False):
+    # Runs in a worker; returns the response body
+    variant = get_variant(name, width, height)
+    svg = _renderer.render(variant)
+    if fmt == "svg":
+        return ET.tostring(svg, encoding="unicode").encode()
+    glyph, elems = get_primitives(svg)
+    path = stroke_to_path(elems, name)
+    if invert:
+        path = invert_path(path, get_bbx_rect(glyph))
+    if fmt == "json":
+        return json.dumps({
+            "name": name,
+            "width": variant["width"],
+            "height": variant["height"],
+            "d": path_to_d(path),
+        }).encode()
+    set_outline(svg, path, invert=invert)
+    return ET.tostring(svg, encoding="unicode").encode()
+
+
+def get_data_mtimes(datadir):
+    return {entry.name: entry.stat().st_mtime
+            for entry in os.scandir(datadir) if entry.name.endswith(".yaml")}
+
+
+class GlyphServer(object):
+    # Serves GET /glyph/NAME?width=W&height=H&format=svg|outline|json
+    # (&invert=1 for outline and json) and GET /stats over HTTP/1.1.
+    # Responses are kept in an LRU cache and concurrent requests for the
+    # same response share a single rendering.
+
+    def __init__(self, jobs=1, cache_size=1024, poll=1.0):
+        self.cache = LRUCache(cache_size)
+        self.pending = {}
+        self.generation = 0
+        self.poll = poll
+        self.requests = 0
+        self.renders = 0
+        self.datadir = get_glyphdb().datadir
+        self.watcher = None
+        if jobs > 1:
+            self.executor = ProcessPoolExecutor(
+                max_workers=jobs, initializer=init_worker,
+                initargs=(cache_size,))
+        else:
+            # The caches of the rendering code are not shared between
+            # threads, so a single thread keeps the event loop responsive
+            init_worker(cache_size)
+            self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def watch_data(self):
+        # Renderings depend on the glyphs used as components, so any change
+        # in the data directory invalidates all cached responses; the
+        # workers re-read changed YAML files by themselves
+        mtimes = get_data_mtimes(self.datadir)
+        while True:
+            await asyncio.sleep(self.poll)
+            current = get_data_mtimes(self.datadir)
+            if current != mtimes:
+                mtimes = current
+                self.cache.clear()
+                self.generation += 1
+                print("data changed; cache cleared", file=sys.stderr)
+
+    def parse_request(self, target):
+        url = urlsplit(target)
+        if url.path == "/stats":
+            return None
+        if not url.path.startswith("/glyph/"):
+            raise RequestError(404, "not found")
+        name = unquote(url.path[len("/glyph/"):])
+        if not NAME_RE.match(name) or not os.path.exists(
+                get_yamlpath(name, self.datadir)):
+            raise RequestError(404, "no such glyph: {0}".format(name))
+        query = {key: values[-1] for key, values in parse_qs(
+            url.query).items()}
+        fmt = query.get("format", "svg")
+        if fmt not in FORMATS:
+            raise RequestError(400, "unknown format: {0}".format(fmt))
+        try:
+            width = query.get("width")
+            width = None if width is None else float(width)
+            height = query.get("height")
+            height = None if height is None else float(height)
+        except ValueError:
+            raise RequestError(400, "invalid size") from None
+        # float() also accepts inf, nan and numbers that overflow to inf
+        if any(value is not None and not (math.isfinite(value) and
+                                          value >= 0)
+               for value in (width, height)) or width == height == 0:
+            raise RequestError(400, "invalid size")
+        if width is not None and height is not None:
+            try:
+                # Sides too small to be scaled up to 360 units
+                normalize_size(width, height)
+            except OverflowError:
+                raise RequestError(400, "invalid size") from None
+        invert = query.get("invert", "0") not in ("0", "")
+        if invert and fmt == "svg":
+            raise RequestError(400, "only outlines can be inverted")
+        return (fmt, name, width, height, invert)
+
+    async def render(self, request):
+        # Normalized so that requests of the same aspect ratio share the
+        # cache entry
+        fmt, name, width, height, invert = request
+        if width is not None and height is not None:
+            width, height = normalize_size(width, height)
+        key = (fmt, name, width, height, invert)
+        body = self.cache.get(key)
+        if body is not None:
+            return body
+        future = self.pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.executor, render_variant, *key)
+            self.pending[key] = future
+            self.renders += 1
+            future.add_done_callback(
+                functools.partial(self.finish, key, self.generation))
+        # A client going away must not cancel the rendering shared with
+        # the other clients
+        return await asyncio.shield(future)
+
+    def finish(self, key, generation, future):
+        del self.pending[key]
+        # Renderings started before the data changed are not cached
+        if (generation == self.generation and not future.cancelled() and
+                future.exception() is None):
+            self.cache[key] = future.result()
+
+    async def respond(self, target):
+        try:
+            request = self.parse_request(target)
+            if request is None:
+                return 200, "application/json", self.get_stats()
+            body = await self.render(request)
+            return 200, FORMATS[request[0]], body
+        except RequestError as exc:
+            return exc.status, "text/plain", str(exc).encode()
+        except FileNotFoundError as exc:
+            # The requested glyph exists, so one of its components does not
+            component = os.path.splitext(
+                os.path.basename(exc.filename or ""))[0]
+            print("error: {0}: missing component {1}".format(
+                target, component), file=sys.stderr)
+            return 500, "text/plain", "missing component: {0}".format(
+                component).encode()
+        except InterpolateError as exc:
+            return 422, "text/plain", str(exc).encode()
+        except Exception as exc:  # pylint: disable=broad-except
+            print("error: {0}: {1}".format(target, exc), file=sys.stderr)
+            return 500, "text/plain", str(exc).encode()
+
+    def get_stats(self):
+        return json.dumps({
+            "requests": self.requests,
+            "renders": self.renders,
+            "cached": len(self.cache),
+            "cache_size": self.cache.maxsize,
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+        }).encode()
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = header.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip().lower()
+                parts = line.decode("latin-1").split()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+                self.requests += 1
+                if method not in ("GET", "HEAD"):
+                    status, ctype, body = 405, "text/plain", b"GET only"
+                else:
+                    status, ctype, body = await self.respond(target)
+                keep_alive = headers.get("connection") != "close" and (
+                    version == "HTTP/1.1" or
+                    headers.get("connection") == "keep-alive")
+                writer.write((
+                    "HTTP/1.1 {0} {1}\r\n"
+                    "Content-Type: {2}\r\n"
+                    "Content-Length: {3}\r\n"
+                    "Connection: {4}\r\n\r\n").format(
+                        status, REASONS[status], ctype, len(body),
+                        "keep-alive" if keep_alive else "close").encode())
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8360, socket=None):
+        if socket is not None:
+            server = await asyncio.start_unix_server(
+                self.handle_client, path=socket)
+            where = socket
+        else:
+            server = await asyncio.start_server(
+                self.handle_client, host=host, port=port)
+            where = "http://{0}:{1}".format(host, port)
+        print("serving on {0}".format(where), file=sys.stderr)
+        # The event loop only keeps a weak reference to the task
+        if self.poll > 0:
+            self.watcher = asyncio.create_task(self.watch_data())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if self.watcher is not None:
+                self.watcher.cancel()
+                self.watcher = None
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="render glyphs at any aspect ratio on request: GET "
+        "/glyph/NAME?width=W&height=H&format=svg|outline|json")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", "-p", type=int, default=8360)
+    parser.add_argument("--socket", "-u", metavar="PATH", default=None,
+                        help="listen on this Unix socket instead")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="number of rendering processes")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="number of responses, and of parsed and "
+                        "interpolated glyphs per process, to keep")
+    parser.add_argument("--poll", type=float, default=1.0,
+                        help="seconds between checks of the data directory "
+                        "for changes (0 to disable)")
+
+    args = parser.parse_args()
+
+    server = GlyphServer(jobs=args.jobs, cache_size=args.cache_size,
+                         poll=args.poll)
+    try:
+        asyncio.run(server.serve(host=args.host, port=args.port,
+                                 socket=args.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,77 @@
+from collections import OrderedDict
+
+
 def parse_numeric(nstr):
     try:
         return int(nstr)
     except ValueError:
         return float(nstr)
+
+
+def write_if_changed(path, content):
+    try:
+        with open(path) as oldfile:
+            if oldfile.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "w") as outfile:
+        outfile.write(content)
+    return True
+
+
+class LRUCache(object):
+    # Mapping that drops the least recently used entries beyond maxsize;
+    # None means unbounded
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.evict()
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def __delitem__(self, key):
+        del self.entries[key]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def items(self):
+        return self.entries.items()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self.evict()
+
+    def evict(self):
+        if self.maxsize is None:
+            return
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
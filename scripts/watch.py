@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import os.path
+import sys
+import threading
+import time
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+import config  # noqa, pylint: disable=unused-import
+from glyphdb import get_glyphdb
+from glyphdb import get_yamlpath
+from mkdeps import DepGraph
+from mkdeps import get_dep_glyphs
+from readsvg import dump_yaml
+from readsvg import readsvg
+from util import write_if_changed
+from writesvg import generate_svg
+from writesvg import SVGRenderer
+
+
+EDITDIR = os.path.join(os.path.dirname(__file__), "..", "edit")
+
+
+def get_svgpath(name):
+    return os.path.join(EDITDIR, "{0}.svg".format(name))
+
+
+class Watcher(FileSystemEventHandler):
+    # Converts edited SVGs to YAML and re-renders the edit SVGs of changed
+    # glyphs and of the glyphs that use them. Events are collected until
+    # none arrives for `debounce` seconds and then handled at once. The
+    # parsed glyphs, the dependency graph and the rendered symbols are
+    # kept and only updated for the glyphs that change.
+
+    def __init__(self, names=None, debounce=0.2):
+        super().__init__()
+        self.names = None if names is None else set(names)
+        self.debounce = debounce
+        self.cond = threading.Condition()
+        self.pending = set()
+        self.last_event = 0.0
+        # path -> mtime of the files written by ourselves
+        self.written = {}
+        self.graph = DepGraph.from_glyphdb()
+        self.renderer = SVGRenderer()
+
+    def on_any_event(self, event):
+        # Ignore opened/closed events caused by merely reading files
+        if event.is_directory or event.event_type not in {
+                "created", "modified", "moved"}:
+            return
+        paths = [event.src_path, getattr(event, "dest_path", None)]
+        with self.cond:
+            for path in paths:
+                if path and path.endswith((".svg", ".yaml")):
+                    self.pending.add(os.path.abspath(path))
+            self.last_event = time.monotonic()
+            self.cond.notify()
+
+    def wait_changes(self):
+        with self.cond:
+            while True:
+                if self.pending:
+                    rest = self.last_event + self.debounce - time.monotonic()
+                    if rest <= 0:
+                        break
+                    self.cond.wait(rest)
+                else:
+                    self.cond.wait()
+            pending = self.pending
+            self.pending = set()
+        return pending
+
+    def is_own_write(self, path):
+        try:
+            return self.written.get(path) == os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+    def write(self, path, content):
+        if write_if_changed(path, content):
+            print("wrote {0}".format(os.path.relpath(path)), file=sys.stderr)
+        self.written[os.path.abspath(path)] = os.stat(path).st_mtime_ns
+
+    def is_target(self, name):
+        return self.names is None or name in self.names
+
+    def handle(self, paths):
+        edited = set()
+        changed = set()
+        for path in sorted(paths):
+            if not os.path.exists(path) or self.is_own_write(path):
+                continue
+            dirname = os.path.basename(os.path.dirname(path))
+            name, ext = os.path.splitext(os.path.basename(path))
+            if not self.is_target(name):
+                continue
+            if dirname == "edit" and ext == ".svg":
+                data = readsvg(path)
+                self.write(get_yamlpath(name), dump_yaml(data))
+                edited.add(name)
+            elif dirname == "data" and ext == ".yaml":
+                changed.add(name)
+
+        if not edited and not changed:
+            return
+        glyphdb = get_glyphdb()
+        for name in sorted(edited | changed):
+            self.graph.update(name, get_dep_glyphs(glyphdb.get(name)))
+        dependents = set()
+        for name in edited | changed:
+            dependents.update(self.graph.rdeps(name))
+        # Symbols of the glyphs that use a changed one contain its symbol
+        self.renderer.forget(edited | changed | dependents)
+        rerender = changed | {
+            dependent for dependent in dependents
+            if os.path.exists(get_svgpath(dependent))}
+        for name in sorted(rerender):
+            self.render(name)
+
+    def render(self, name):
+        svg = generate_svg(get_glyphdb().get(name), renderer=self.renderer)
+        self.write(get_svgpath(name), svg)
+
+    def run(self):
+        observer = Observer()
+        for dirname in (EDITDIR, os.path.dirname(get_yamlpath(""))):
+            observer.schedule(self, dirname)
+        observer.start()
+        try:
+            while True:
+                try:
+                    self.handle(self.wait_changes())
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Keep watching even if a file is broken while editing
+                    print("error: {0}".format(exc), file=sys.stderr)
+        finally:
+            observer.stop()
+            observer.join()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("names", nargs="*",
+                        help="glyphs to watch (default: all)")
+    parser.add_argument("--debounce", type=float, default=0.2)
+
+    args = parser.parse_args()
+
+    os.makedirs(EDITDIR, exist_ok=True)
+    watcher = Watcher(names=args.names or None, debounce=args.debounce)
+    for name in args.names:
+        if not os.path.exists(get_svgpath(name)):
+            watcher.render(name)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,206 +1,94 @@
 #!/usr/bin/env python3
 
+from concurrent.futures import ProcessPoolExecutor
 import os.path
 import sys
 import xml.etree.ElementTree as ET
 
-import svgpathtools
 import yaml
 
 import config  # noqa, pylint: disable=unused-import
+from glyphdb import get_glyphdb
+from glyphdb import load_file
+from keyarray import compile_key
+from keyarray import interpolate_compiled
+from keyarray import InterpolateError  # noqa, pylint: disable=unused-import
+from keyarray import set_cache_size as set_compiled_cache_size
+from mkdeps import DepGraph
+from primitives import compile_glyph
+from primitives import GlyphRecord
+from primitives import Path
+from primitives import Rect
+from primitives import Use
+from profiling import add_profile_argument
+from profiling import call_worker
+from profiling import merge_worker
+from profiling import setup_profile
+from profiling import stage
+from util import LRUCache
 from util import parse_numeric
+from util import write_if_changed
 from xmlns import INKSCAPE_NS
 from xmlns import SVG_NS
 from xmlns import XLINK_NS
 
 
-# monkey-patch svgpathtools.path.scale
-_orig_scale = svgpathtools.path.scale
-
-
-def _my_scale(curve, sx, sy=None, origin=0j):
-    try:
-        return _orig_scale(curve, sx, sy, origin)
-    except Exception as err:
-        if err.args != (
-                "\nFor `Arc` objects, only scale transforms "
-                "with sx==sy are implemented.\n",):
-            raise
-
-    assert isinstance(curve, svgpathtools.path.Arc)
-    if curve.rotation != 0.0:
-        raise Exception("\nFor `Arc` objects with rotation!=0.0, "
-                        "only scale transforms with sx==sy are implemented")
-
-    assert sy is not None
-    isy = sy * 1j
-
-    def _scale(z):
-        return sx * z.real + isy * z.imag
-
-    return svgpathtools.path.Arc(
-        start=_scale(curve.start - origin) + origin,
-        radius=_scale(curve.radius),
-        rotation=curve.rotation,
-        large_arc=curve.large_arc,
-        sweep=curve.sweep,
-        end=_scale(curve.end - origin) + origin)
-
-
-svgpathtools.path.scale = _my_scale
-
-
-def get_yamlpath(name):
-    return os.path.join(os.path.dirname(__file__), "..",
-                        "data", "{0}.yaml".format(name))
-
-
 def load_yaml(name):
-    with open(get_yamlpath(name)) as yamlfile:
-        return yaml.safe_load(yamlfile)
+    return get_glyphdb().get(name)
 
 
 def resized_glyph(data, width, height, dx=0.0, dy=0.0):
     if width == data["width"] and height == data["height"] and dx == dy == 0.0:
         return data["data"]
+    with stage("resize"):
+        return _resized_glyph(data, width, height, dx, dy)
+
+
+def _resized_glyph(data, width, height, dx, dy):
     xscale = width / data["width"]
     yscale = height / data["height"]
     glyph = []
-    for line in data["data"]:
-        tokens = line.split()
-        assert tokens[0] in {"use", "rect", "path"}
-        if tokens[0] == "use":
-            x, y, width, height = [float(x) for x in tokens[1:5]]
-            name = tokens[5]
-            glyph.append("use {0} {1} {2} {3} {4}".format(
-                x * xscale + dx,
-                y * yscale + dy,
-                width * xscale,
-                height * yscale,
-                name
+    for prim in data["data"]:
+        if isinstance(prim, Use):
+            glyph.append(Use(
+                prim.x * xscale + dx,
+                prim.y * yscale + dy,
+                prim.width * xscale,
+                prim.height * yscale,
+                prim.name
             ))
-        elif tokens[0] == "rect":
-            x, y, width, height = [float(x) for x in tokens[1:]]
-            glyph.append("rect {0} {1} {2} {3}".format(
-                x * xscale + dx,
-                y * yscale + dy,
-                width * xscale,
-                height * yscale
+        elif isinstance(prim, Rect):
+            glyph.append(Rect(
+                prim.x * xscale + dx,
+                prim.y * yscale + dy,
+                prim.width * xscale,
+                prim.height * yscale
             ))
-        elif tokens[0] == "path":
-            d = " ".join(tokens[1:])
-            resized_d = (
-                svgpathtools.parse_path(d)
-                .scaled(xscale, yscale)
-                .translated(complex(dx, dy))
-            ).d()
-            glyph.append("path {0}".format(resized_d))
+        elif isinstance(prim, Path):
+            # The path data is only formatted if it is written out
+            glyph.append(Path(parsed=prim.parsed().resized(
+                xscale, yscale, dx, dy)))
     return glyph
 
 
-class InterpolateError(ValueError):
-    pass
-
-
-def interpolate_path(path0, path1, interpolator):
-    if len(path0) != len(path1):
-        raise InterpolateError("number of segments do not match")
-
-    segments = []
-    for seg0, seg1 in zip(path0, path1):
-        if type(seg0) != type(seg1):  # pylint: disable=unidiomatic-typecheck
-            raise InterpolateError("type of segments do not match")
-
-        if svgpathtools.is_bezier_segment(seg0):
-            segments.append(svgpathtools.bpoints2bezier([
-                interpolator(bp0, bp1)
-                for bp0, bp1 in zip(seg0.bpoints(), seg1.bpoints())
-            ]))
-        elif isinstance(seg0, svgpathtools.Arc):
-            if not seg0.rotation == seg1.rotation == 0:
-                raise InterpolateError(
-                    "cannot interpolate arc segments with rotation")
-            if seg0.large_arc != seg1.large_arc or seg0.sweep != seg1.sweep:
-                raise InterpolateError("arc segments' flags do not match")
-
-            start = interpolator(seg0.start, seg1.start)
-            radius = interpolator(seg0.radius, seg1.radius)
-            end = interpolator(seg0.end, seg1.end)
-            segments.append(svgpathtools.Arc(
-                start=start, radius=radius, rotation=seg0.rotation,
-                large_arc=seg0.large_arc, sweep=seg0.sweep, end=end))
-        else:
-            raise TypeError("unsupported segment type")
-
-    return svgpathtools.Path(*segments)
-
-
 def interpolate_key(key0, key1, width, height):
-    def interpolate_factory():
-        width0 = key0["width"]
-        height0 = key0["height"]
-        width1 = key1["width"]
-        height1 = key1["height"]
-        # Calculate the plane ax+by+cz=0 that contains three points:
-        # (0, 0, 0), (width0, width1, width) and (height0, height1, height).
+    width0 = key0["width"]
+    height0 = key0["height"]
+    width1 = key1["width"]
+    height1 = key1["height"]
+    # Calculate the plane ax+by+cz=0 that contains three points:
+    # (0, 0, 0), (width0, width1, width) and (height0, height1, height).
 
-        # [a, b, c] = [width0, width1, width] x [height0, height1, height]
-        a = width1 * height - width * height1
-        b = width * height0 - width0 * height
-        c = width0 * height1 - width1 * height0
+    # [a, b, c] = [width0, width1, width] x [height0, height1, height]
+    a = width1 * height - width * height1
+    b = width * height0 - width0 * height
+    c = width0 * height1 - width1 * height0
 
-        # Then z=(-a/c)x+(-b/c)y
-        c0 = -a / c
-        c1 = -b / c
-        return lambda x0, x1: x0 * c0 + x1 * c1
+    # Then z=(-a/c)x+(-b/c)y
+    c0 = -a / c
+    c1 = -b / c
 
-    interpolate = interpolate_factory()
-
-    if len(key0["data"]) != len(key1["data"]):
-        raise InterpolateError("numbers of lines do not match")
-
-    glyph = []
-    for line0, line1 in zip(key0["data"], key1["data"]):
-        tokens0 = line0.split()
-        tokens1 = line1.split()
-        if tokens0[0] != tokens1[0]:
-            raise InterpolateError("linetypes do not match")
-        linetype = tokens0[0]
-
-        assert linetype in {"use", "rect", "path"}
-        if linetype == "use":
-            if tokens0[5] != tokens1[5]:
-                raise InterpolateError("use names do not match")
-            name = tokens0[5]
-
-            x0, y0, width0, height0 = [float(x) for x in tokens0[1:5]]
-            x1, y1, width1, height1 = [float(x) for x in tokens1[1:5]]
-            glyph.append("use {0} {1} {2} {3} {4}".format(
-                interpolate(x0, x1),
-                interpolate(y0, y1),
-                interpolate(width0, width1),
-                interpolate(height0, height1),
-                name
-            ))
-        elif linetype == "rect":
-            x0, y0, width0, height0 = [float(x) for x in tokens0[1:]]
-            x1, y1, width1, height1 = [float(x) for x in tokens1[1:]]
-            glyph.append("rect {0} {1} {2} {3}".format(
-                interpolate(x0, x1),
-                interpolate(y0, y1),
-                interpolate(width0, width1),
-                interpolate(height0, height1)
-            ))
-        elif linetype == "path":
-            d0 = " ".join(tokens0[1:])
-            d1 = " ".join(tokens1[1:])
-            interpolated_d = interpolate_path(
-                svgpathtools.parse_path(d0),
-                svgpathtools.parse_path(d1),
-                interpolate
-            ).d()
-            glyph.append("path {0}".format(interpolated_d))
-    return glyph
+    return interpolate_compiled(compile_key(key0), compile_key(key1), c0, c1)
 
 
 def div_inf(x, y):
@@ -243,9 +131,30 @@ def normalize_size(width, height):
     return int(round(scale * width)), int(round(scale * height))
 
 
+# Unbounded for the scripts; long-lived processes bound it by set_cache_size
+_interpolated_cache = LRUCache()
+
+
+def set_cache_size(maxsize):
+    # Maximum number of interpolated glyphs and of compiled keys kept
+    _interpolated_cache.resize(maxsize)
+    set_compiled_cache_size(maxsize)
+
+
 def get_interpolated_data(name, width, height):
     data = load_yaml(name)
     width, height = normalize_size(width, height)
+    cached = _interpolated_cache.get((name, width, height))
+    # Cached results are only valid for the same parsed record
+    if cached is not None and cached[0] is data:
+        return cached[1]
+    with stage("interpolate"):
+        result = _get_interpolated_data(name, data, width, height)
+    _interpolated_cache[name, width, height] = (data, result)
+    return result
+
+
+def _get_interpolated_data(name, data, width, height):
     if "keys" in data and data["keys"]:
         return {
             "name": "{0}-{1}-{2}".format(name, width, height),
@@ -253,7 +162,7 @@ def get_interpolated_data(name, width, height):
             "height": height,
             "data": interpolate_keys(data["keys"], width, height),
         }
-    if any(line.split()[0] == "use" for line in data["data"]):
+    if any(isinstance(prim, Use) for prim in data["data"]):
         return {
             "name": "{0}-{1}-{2}".format(name, width, height),
             "width": width,
@@ -263,6 +172,23 @@ def get_interpolated_data(name, width, height):
     return data
 
 
+def get_resized_record(name, data, width, height):
+    # Glyph record of the glyph used as a component of the given size,
+    # e.g. to render it at another aspect ratio with SVGRenderer
+    xscale = width / data["width"]
+    yscale = height / data["height"]
+    rect = [parse_numeric(x) for x in data["rect"].split()]
+    return GlyphRecord({
+        "name": "{0}-{1}-{2}".format(name, width, height),
+        "width": width,
+        "height": height,
+        "rect": "{0} {1} {2} {3}".format(
+            rect[0] * xscale, rect[1] * yscale,
+            rect[2] * xscale, rect[3] * yscale),
+        "data": [Use(0, 0, width, height, name)],
+    })
+
+
 class SVGRenderer(object):
     def __init__(self, expand=False):
         self.expand = expand
@@ -275,8 +201,15 @@ class SVGRenderer(object):
         self.glyph = None
         self.keys = []
 
+        # Shared across glyphs rendered by the same instance
+        self.symbols = {}
+        self.css = None
+
     def render(self, data):
+        data = compile_glyph(data)
         self.name = data["name"]
+        self.defs = {}
+        self.keys = []
         self.width = data["width"]
         self.height = data["height"]
         self.rect = [parse_numeric(x) for x in data["rect"].split()]
@@ -300,26 +233,21 @@ class SVGRenderer(object):
 
     def render_data(self, glyphdata):
         elements = []
-        for line in glyphdata:
-            tokens = line.split()
-            assert tokens[0] in {"use", "rect", "path"}
-            if tokens[0] == "use":
-                x, y, width, height = [parse_numeric(x) for x in tokens[1:5]]
-                name = tokens[5]
-                elements.extend(self.use(x, y, width, height, name))
-            elif tokens[0] == "rect":
-                x, y, width, height = [parse_numeric(x) for x in tokens[1:]]
+        for prim in glyphdata:
+            if isinstance(prim, Use):
+                elements.extend(self.use(
+                    prim.x, prim.y, prim.width, prim.height, prim.name))
+            elif isinstance(prim, Rect):
                 element = ET.Element(SVG_NS + "rect", {
-                    "x": "{0}".format(x),
-                    "y": "{0}".format(y),
-                    "width": "{0}".format(width),
-                    "height": "{0}".format(height),
+                    "x": "{0}".format(prim.x),
+                    "y": "{0}".format(prim.y),
+                    "width": "{0}".format(prim.width),
+                    "height": "{0}".format(prim.height),
                 })
                 elements.append(element)
-            elif tokens[0] == "path":
-                d = " ".join(tokens[1:])
+            elif isinstance(prim, Path):
                 element = ET.Element(SVG_NS + "path", {
-                    "d": d,
+                    "d": prim.d,
                 })
                 elements.append(element)
         return elements
@@ -344,9 +272,27 @@ class SVGRenderer(object):
         data = get_interpolated_data(name, width, height)
         symbol_id = data["name"]
         if symbol_id not in self.defs:
-            self.defs[symbol_id] = self.render_symbol(data)
+            cached = self.symbols.get(symbol_id)
+            if cached is None or cached[1] is not data:
+                outer_defs = self.defs
+                self.defs = {}
+                symbol = self.render_symbol(data)
+                cached = (name, data, symbol, self.defs)
+                self.symbols[symbol_id] = cached
+                self.defs = outer_defs
+            _name, _data, symbol, subdefs = cached
+            for sub_id, subsymbol in subdefs.items():
+                self.defs.setdefault(sub_id, subsymbol)
+            self.defs[symbol_id] = symbol
         return symbol_id
 
+    def forget(self, names):
+        # Drops the symbols of the given glyphs, whose records have changed
+        # or whose symbols contain those of changed glyphs
+        for symbol_id, cached in list(self.symbols.items()):
+            if cached[0] in names:
+                del self.symbols[symbol_id]
+
     def render_symbol(self, data):
         symbol = ET.Element(SVG_NS + "symbol", {
             "id": data["name"],
@@ -366,9 +312,11 @@ class SVGRenderer(object):
         })
         svg.append(self.render_defs())
         style = ET.Element(SVG_NS + "style")
-        with open(os.path.join(os.path.dirname(__file__),
-                               "edit.css")) as cssfile:
-            style.text = cssfile.read()
+        if self.css is None:
+            with open(os.path.join(os.path.dirname(__file__),
+                                   "edit.css")) as cssfile:
+                self.css = cssfile.read()
+        style.text = self.css
         svg.append(style)
         svg.extend(self.keys)
         g_elem = ET.Element(SVG_NS + "g", {
@@ -393,24 +341,98 @@ class SVGRenderer(object):
         return defs
 
 
-def generate_svg(data, *args, **kwargs):
-    renderer = SVGRenderer(*args, **kwargs)
-    elem = renderer.render(data)
-    return ET.tostring(elem, encoding="unicode")
+def generate_svg(data, *args, renderer=None, **kwargs):
+    if renderer is None:
+        renderer = SVGRenderer(*args, **kwargs)
+    with stage("render", data.get("name")):
+        elem = renderer.render(data)
+        with stage("serialize"):
+            return ET.tostring(elem, encoding="unicode")
+
+
+def get_outname(infile):
+    return os.path.splitext(os.path.basename(infile))[0] + ".svg"
+
+
+def render_files(infiles, expand=False):
+    renderer = SVGRenderer(expand=expand)
+    svgs = []
+    for infile in infiles:
+        svgs.append(generate_svg(load_file(infile), renderer=renderer))
+    return svgs
+
+
+def schedule_files(infiles, jobs):
+    # Give each worker glyphs that share components so that each component
+    # is loaded and interpolated by as few workers as possible.
+    graph = DepGraph.from_glyphdb()
+
+    def get_components(infile):
+        name = os.path.splitext(os.path.basename(infile))[0]
+        if name not in graph.depmap:
+            return set()
+        return graph.subdeps(name)
+
+    components = {infile: get_components(infile) for infile in infiles}
+    chunks = [[] for _ in range(jobs)]
+    loaded = [set() for _ in range(jobs)]
+    costs = [0] * jobs
+    for infile in sorted(infiles, key=lambda f: -len(components[f])):
+        comps = components[infile]
+        i = min(range(jobs),
+                key=lambda i: costs[i] + len(comps - loaded[i]))
+        chunks[i].append(infile)
+        costs[i] += 1 + len(comps - loaded[i])
+        loaded[i].update(comps)
+    return [chunk for chunk in chunks if chunk]
+
+
+def generate_svgs(infiles, outdir, expand=False, jobs=1):
+    if jobs <= 1 or len(infiles) <= 1:
+        chunks = [infiles]
+        results = [render_files(infiles, expand=expand)]
+    else:
+        chunks = schedule_files(infiles, jobs)
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            results = [merge_worker(result) for result in executor.map(
+                call_worker, [render_files] * len(chunks), chunks,
+                [expand] * len(chunks))]
+    for chunk, svgs in zip(chunks, results):
+        for infile, svg in zip(chunk, svgs):
+            with stage("write"):
+                write_if_changed(
+                    os.path.join(outdir, get_outname(infile)), svg)
 
 
 def main():
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("infile", nargs="?", type=argparse.FileType("r"),
-                        default=sys.stdin)
+    parser.add_argument("infile", nargs="*")
     parser.add_argument("--outfile", "-o", default=None)
+    parser.add_argument("--outdir", "-d", default=None)
+    parser.add_argument("--jobs", "-j", type=int, default=1)
 
     parser.add_argument("--expand", action="store_true")
+    add_profile_argument(parser)
 
     args = parser.parse_args()
-
-    indata = yaml.safe_load(args.infile)
+    setup_profile(args.profile)
+
+    if args.outdir is not None:
+        if args.outfile is not None:
+            parser.error("--outfile and --outdir are mutually exclusive")
+        generate_svgs(args.infile, args.outdir, expand=args.expand,
+                      jobs=args.jobs)
+        return
+
+    if len(args.infile) > 1:
+        parser.error("--outdir is required for multiple input files")
+    with stage("parse_yaml"):
+        if args.infile:
+            with open(args.infile[0]) as infile:
+                indata = yaml.safe_load(infile)
+        else:
+            indata = yaml.safe_load(sys.stdin)
     svg = generate_svg(indata, expand=args.expand)
     if args.outfile is None:
         sys.stdout.write(svg)
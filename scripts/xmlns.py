@@ -12,7 +12,13 @@ NSMAP = {
     "sodipodi": SODIPODI_NS[1:-1],
 }
 
-for k, v in NSMAP.items():
-    ET.register_namespace(k, v)
 
-ET.register_namespace("", SVG_NS[1:-1])
+
+def register_namespaces():
+    for k, v in NSMAP.items():
+        ET.register_namespace(k, v)
+
+    ET.register_namespace("", SVG_NS[1:-1])
+
+
+register_namespaces()